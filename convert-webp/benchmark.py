@@ -0,0 +1,253 @@
+import argparse
+import json
+import pathlib
+import platform
+import random
+import resource
+import shlex
+import shutil
+import subprocess
+import tempfile
+import time
+import zipfile
+
+from rich.table import Table
+
+from webp_converter import archive, encoders, estimate, pipeline, workdir
+from webp_converter.encoders import EncodeOptions
+from webp_converter.scheduler import LibraryScheduler
+from webp_converter.utils import console
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:
+    Image = None
+
+PAGE_FORMATS = ["JPEG", "JPEG", "PNG", "GIF"]
+PAGE_SIZES = [(800, 1200), (1280, 1920), (1988, 3056)]
+
+
+def make_page(rng, size, fmt):
+    # Flat panels with a few shapes and some noise compress roughly like scans
+    image = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(rng.randrange(10, 40)):
+        x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+        x1, y1 = x0 + rng.randrange(20, 400), y0 + rng.randrange(20, 400)
+        fill = tuple(rng.randrange(256) for _ in range(3))
+        shape = draw.ellipse if rng.random() < 0.5 else draw.rectangle
+        shape([x0, y0, x1, y1], fill=fill, outline=(0, 0, 0), width=3)
+    image = Image.blend(image, Image.effect_noise(size, 24).convert("RGB"), 0.15)
+    if fmt == "GIF":
+        image = image.convert("P", palette=Image.ADAPTIVE)
+
+    out = tempfile.SpooledTemporaryFile()
+    image.save(out, fmt, **({"quality": 90} if fmt == "JPEG" else {}))
+    out.seek(0)
+    return out.read()
+
+
+def generate_corpus(root, archives=4, pages=24, seed=1234):
+    """Write a reproducible set of CBZ (and CBR, if rar is installed) files."""
+    rng = random.Random(seed)
+    root.mkdir(parents=True, exist_ok=True)
+    corpus = []
+    for i in range(archives):
+        comic = root / f"bench-{i:03}.cbz"
+        page_count = rng.randrange(pages // 2, pages * 2)
+        with zipfile.ZipFile(comic, "w", zipfile.ZIP_DEFLATED) as archive:
+            for page in range(page_count):
+                fmt = rng.choice(PAGE_FORMATS)
+                ext = {"JPEG": "jpg", "PNG": "png", "GIF": "gif"}[fmt]
+                data = make_page(rng, rng.choice(PAGE_SIZES), fmt)
+                archive.writestr(f"page-{page:03}.{ext}", data)
+            archive.writestr("ComicInfo.xml", "<ComicInfo></ComicInfo>")
+        corpus.append(comic)
+
+    if shutil.which("rar"):
+        # Repack the first archive as a CBR so the unrar path is covered too
+        work = root / "rar-src"
+        with zipfile.ZipFile(corpus[0]) as archive:
+            archive.extractall(work)
+        comic = root / "bench-rar.cbr"
+        subprocess.run(
+            shlex.split(f"rar a -ep -inul {comic} {work}/*"),
+            check=True,
+        )
+        shutil.rmtree(work)
+        corpus.append(comic)
+    else:
+        console.print("[yellow]rar not found, skipping CBR samples[/yellow]")
+    return corpus
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux; children covers the encoder pool and 7z
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+
+def summarize(corpus, outputs, pages, seconds):
+    source_bytes = sum(c.stat().st_size for c in corpus)
+    # A rolled-back conversion leaves the source as the library's copy
+    output_bytes = sum(
+        (o if o.exists() else c).stat().st_size for c, o in zip(corpus, outputs)
+    )
+    return {
+        "seconds": round(seconds, 3),
+        "pages": pages,
+        "pages_per_sec": round(pages / seconds, 2),
+        "mb_per_sec": round(source_bytes / seconds / 2**20, 2),
+        "source_mb": round(source_bytes / 2**20, 2),
+        "output_mb": round(output_bytes / 2**20, 2),
+        "saved_pct": round((1 - output_bytes / source_bytes) * 100, 1),
+    }
+
+
+def clean_outputs(corpus):
+    for comic in corpus:
+        archive.output_path(comic).unlink(missing_ok=True)
+
+
+def bench_stages(corpus, options, jobs):
+    stages = {"extract": 0.0, "encode": 0.0, "pack": 0.0}
+    pages = 0
+    for comic in corpus:
+        work_path = workdir.create_work_dir(comic)
+        start = time.perf_counter()
+        workdir.extract_comic(work_path, comic, jobs)
+        stages["extract"] += time.perf_counter() - start
+        pages += len(workdir.list_images(work_path))
+
+        start = time.perf_counter()
+        pipeline.convert_images_to_webp(work_path, jobs, options)
+        stages["encode"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        archive.create_comic_archive(work_path, archive.output_path(comic))
+        stages["pack"] += time.perf_counter() - start
+        shutil.rmtree(work_path)
+
+    results = {}
+    for stage, seconds in stages.items():
+        results[stage] = {
+            "seconds": round(seconds, 3),
+            "pages_per_sec": round(pages / seconds, 2) if seconds else None,
+        }
+    return results
+
+
+def bench_end_to_end(corpus, options, jobs, stream):
+    # Listed from the headers, so CBR pages count as well
+    pages = len(estimate.library_pages(corpus, jobs))
+    scheduler = LibraryScheduler(jobs=jobs, options=options, stream=stream)
+    start = time.perf_counter()
+    scheduler.run(corpus)
+    return summarize(
+        corpus,
+        [archive.output_path(c) for c in corpus],
+        pages,
+        time.perf_counter() - start,
+    )
+
+
+def compare(results, baseline, tolerance):
+    """Print throughput against the baseline and return the regressions."""
+    table = Table(title="Benchmark vs baseline")
+    table.add_column("Metric")
+    table.add_column("Baseline", justify="right")
+    table.add_column("Current", justify="right")
+    table.add_column("Change", justify="right")
+
+    regressions = []
+    for section in ("runs", "stages"):
+        for name, metrics in results[section].items():
+            label = f"{section} {name} pages/s"
+            old = baseline.get(section, {}).get(name, {}).get("pages_per_sec")
+            new = metrics["pages_per_sec"]
+            if not old or not new:
+                continue
+            change = (new - old) / old * 100
+            colour = "red" if change < -tolerance else "green"
+            table.add_row(
+                label, f"{old}", f"{new}", f"[{colour}]{change:+.1f}%[/{colour}]"
+            )
+            if change < -tolerance:
+                regressions.append(label)
+    console.print(table)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the WebP conversion pipeline on a synthetic corpus."
+    )
+    parser.add_argument("--archives", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=24)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("-j", "--jobs", type=int, default=None)
+    parser.add_argument(
+        "-e", "--encoder", choices=["auto", *encoders.ENCODERS], default="auto"
+    )
+    parser.add_argument(
+        "--corpus",
+        default="./bench-corpus",
+        help="Where to generate the synthetic archives (default: ./bench-corpus).",
+    )
+    parser.add_argument(
+        "--baseline",
+        default="bench_baseline.json",
+        help="JSON baseline to compare against (default: bench_baseline.json).",
+    )
+    parser.add_argument(
+        "--save", action="store_true", help="Write these results as the new baseline."
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=10.0,
+        help="Allowed throughput drop in percent before flagging (default: 10).",
+    )
+    args = parser.parse_args()
+
+    if Image is None:
+        parser.error("generating the corpus needs Pillow")
+
+    corpus_dir = pathlib.Path(args.corpus)
+    shutil.rmtree(corpus_dir, ignore_errors=True)
+    corpus = generate_corpus(corpus_dir, args.archives, args.pages, args.seed)
+    options = EncodeOptions(encoders.resolve_encoder(args.encoder))
+
+    results = {
+        "host": {"platform": platform.platform(), "python": platform.python_version()},
+        "corpus": {"archives": args.archives, "pages": args.pages, "seed": args.seed},
+        "encoder": options.encoder,
+        "runs": {},
+    }
+    results["stages"] = bench_stages(corpus, options, args.jobs)
+    clean_outputs(corpus)
+    results["runs"]["workdir"] = bench_end_to_end(corpus, options, args.jobs, False)
+    clean_outputs(corpus)
+    results["runs"]["stream"] = bench_end_to_end(corpus, options, args.jobs, True)
+    clean_outputs(corpus)
+    results["peak_rss_mb"] = round(peak_rss_mb(), 1)
+
+    console.print_json(data=results)
+
+    baseline_path = pathlib.Path(args.baseline)
+    regressions = []
+    if baseline_path.exists():
+        regressions = compare(
+            results, json.loads(baseline_path.read_text()), args.tolerance
+        )
+    if args.save:
+        baseline_path.write_text(json.dumps(results, indent=4))
+        console.print(f"[green]Saved baseline to {baseline_path}[/green]")
+    if regressions:
+        console.print(f"[red]Regressed: {', '.join(regressions)}[/red]")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
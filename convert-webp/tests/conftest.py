@@ -0,0 +1,5 @@
+import pathlib
+import sys
+
+# The package isn't installed; import it from the checkout like the scripts do
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
@@ -0,0 +1,78 @@
+import json
+import zipfile
+
+from webp_converter import archive
+from webp_converter.archive import write_comic_zip
+
+COMIC_INFO = b"<ComicInfo><Summary>" + b"words " * 2000 + b"</Summary></ComicInfo>"
+
+
+def make_members(tmp_path):
+    pages = {
+        "p000.webp": b"RIFF\x00\x00\x00\x00WEBP" + bytes(range(256)) * 8,
+        "Über – p001.webp": b"RIFF\x00\x00\x00\x00WEBP" + b"\x01" * 4096,
+        "ComicInfo.xml": COMIC_INFO,
+    }
+    members = []
+    (tmp_path / "work").mkdir()
+    for name, data in pages.items():
+        path = tmp_path / "work" / name
+        path.write_bytes(data)
+        members.append((name, path))
+    return pages, members
+
+
+def check_round_trip(output, pages):
+    with zipfile.ZipFile(output) as result:
+        assert result.testzip() is None
+        assert sorted(result.namelist()) == sorted(pages)
+        for name, data in pages.items():
+            assert result.read(name) == data
+        return {info.filename: info for info in result.infolist()}
+
+
+def test_round_trip(tmp_path):
+    pages, members = make_members(tmp_path)
+    output = tmp_path / "out.cbz"
+    write_comic_zip(output, members, jobs=2)
+    infos = check_round_trip(output, pages)
+
+    assert infos["Über – p001.webp"].flag_bits & 0x800
+    assert not infos["p000.webp"].flag_bits & 0x800
+    assert infos["ComicInfo.xml"].compress_type == zipfile.ZIP_DEFLATED
+    assert infos["p000.webp"].compress_type == zipfile.ZIP_STORED
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def test_zip64_fallback(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ZIP32_MAX_MEMBERS", 2)
+    pages, members = make_members(tmp_path)
+    output = tmp_path / "out.cbz"
+    write_comic_zip(output, members)
+    infos = check_round_trip(output, pages)
+    assert infos["ComicInfo.xml"].compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_manifest_marks_untouched_pages_original():
+    manifest = json.loads(
+        archive.page_manifest(
+            [
+                ("p000.jpg", "p000.avif", 10),
+                ("p001.png", "p001.png", 20),
+                ("p002.webp", "p002.webp", 30),
+            ]
+        )
+    )
+    codecs = {name: page["codec"] for name, page in manifest["pages"].items()}
+    assert codecs == {
+        "p000.avif": "avif",
+        "p001.png": "original",
+        "p002.webp": "original",
+    }
+
+
+def test_is_output():
+    assert archive.is_output("library/a.cbr.cbz")
+    assert archive.is_output("library/a.cbz.cbz")
+    assert not archive.is_output("library/a.cbz")
+    assert not archive.is_output("library/a.cbr.cbz", in_place=True)
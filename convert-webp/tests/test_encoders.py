@@ -0,0 +1,45 @@
+import io
+
+import pytest
+
+from webp_converter.encoders import (
+    DEVICE_PROFILES,
+    HAS_NUMPY,
+    HAS_PILLOW,
+    QUALITY_MAX,
+    QUALITY_MIN,
+    EncodeOptions,
+    search_quality,
+)
+
+pytestmark = pytest.mark.skipif(not HAS_PILLOW, reason="needs Pillow with WebP")
+
+
+def gray_page():
+    from PIL import Image
+
+    out = io.BytesIO()
+    Image.effect_noise((320, 480), 48).save(out, "PNG")
+    assert Image.open(io.BytesIO(out.getvalue())).mode == "L"
+    return out.getvalue()
+
+
+def test_search_quality_byte_budget_on_grayscale_page():
+    options = EncodeOptions("pillow", target_bytes=8 * 1024)
+    quality = search_quality(io.BytesIO(gray_page()), options)
+    assert QUALITY_MIN <= quality <= QUALITY_MAX
+
+
+@pytest.mark.skipif(not HAS_NUMPY, reason="needs numpy")
+def test_search_quality_ssim_on_grayscale_page():
+    options = EncodeOptions("pillow", target_ssim=0.9)
+    quality = search_quality(io.BytesIO(gray_page()), options)
+    assert QUALITY_MIN <= quality <= QUALITY_MAX
+
+
+def test_search_quality_with_grayscale_profile():
+    options = EncodeOptions(
+        "pillow", target_bytes=4 * 1024, profile=DEVICE_PROFILES["kindle"]
+    )
+    quality = search_quality(io.BytesIO(gray_page()), options)
+    assert QUALITY_MIN <= quality <= QUALITY_MAX
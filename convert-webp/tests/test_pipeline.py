@@ -0,0 +1,70 @@
+import io
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from rich.progress import Progress
+
+from webp_converter.cache import PageCache
+from webp_converter.encoders import HAS_PILLOW, EncodeOptions
+from webp_converter.pipeline import stream_comic
+
+pytestmark = pytest.mark.skipif(not HAS_PILLOW, reason="needs Pillow with WebP")
+
+
+def page(fmt):
+    from PIL import Image
+
+    out = io.BytesIO()
+    Image.effect_noise((64, 96), 32).convert("RGB").save(out, fmt)
+    return out.getvalue()
+
+
+def write_mixed(path):
+    pages = {
+        "p000.jpg": page("JPEG"),
+        "p001.png": page("PNG"),
+        "p002.webp": page("WEBP"),
+        "ComicInfo.xml": b"<ComicInfo/>",
+    }
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, data in pages.items():
+            archive.writestr(name, data)
+    return pages
+
+
+def stream(source, output, slots, **kwargs):
+    options = EncodeOptions("pillow", keep_smaller=False)
+    with Progress(disable=True) as progress, ThreadPoolExecutor(2) as pool:
+        return stream_comic(source, output, pool, progress, slots, options, **kwargs)
+
+
+def test_stream_keeps_already_encoded_pages(tmp_path):
+    source = tmp_path / "mixed.cbz"
+    pages = write_mixed(source)
+    output = tmp_path / "out.cbz"
+    stream(source, output, threading.BoundedSemaphore(2))
+    with zipfile.ZipFile(output) as result:
+        assert sorted(result.namelist()) == [
+            "ComicInfo.xml",
+            "p000.webp",
+            "p001.webp",
+            "p002.webp",
+        ]
+        assert result.read("p002.webp") == pages["p002.webp"]
+        assert result.getinfo("p002.webp").compress_type == zipfile.ZIP_STORED
+
+
+def test_stream_releases_slots_on_unreadable_page(tmp_path):
+    source = tmp_path / "corrupt.cbz"
+    pages = write_mixed(source)
+    raw = bytearray(source.read_bytes())
+    raw[raw.index(pages["p001.png"]) + 100] ^= 0xFF
+    source.write_bytes(raw)
+    slots = threading.BoundedSemaphore(2)
+    cache = PageCache(tmp_path / "cache", 1 << 20)
+    with pytest.raises(zipfile.BadZipFile):
+        stream(source, tmp_path / "out.cbz", slots, cache=cache)
+    assert slots.acquire(blocking=False) and slots.acquire(blocking=False)
+    assert not (tmp_path / "out.cbz").exists()
@@ -0,0 +1,32 @@
+import subprocess
+import sys
+import time
+
+import pytest
+
+from webp_converter import throttle
+
+WRITE_4MB = "import sys; [sys.stdout.buffer.write(bytes(2**20)) for _ in range(4)]"
+
+
+@pytest.fixture
+def capped():
+    throttle.limit_bandwidth(2 * 2**20)
+    yield
+    throttle.limit_bandwidth(None)
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="paces through /proc")
+def test_run_throttled_paces_the_tool(capped, tmp_path):
+    start = time.monotonic()
+    throttle.run_throttled(
+        ["sh", "-c", f'exec {sys.executable} -c "{WRITE_4MB}" > {tmp_path / "out"}']
+    )
+    # One second of burst, then 2 MB/s for the rest
+    assert time.monotonic() - start >= 0.9
+    assert (tmp_path / "out").stat().st_size == 4 * 2**20
+
+
+def test_run_throttled_reports_failures(capped):
+    with pytest.raises(subprocess.CalledProcessError):
+        throttle.run_throttled(["sh", "-c", "exit 2"])
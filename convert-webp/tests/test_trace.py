@@ -0,0 +1,33 @@
+import json
+import multiprocessing
+import sys
+
+import pytest
+
+from webp_converter import trace
+
+
+def record_span():
+    with trace.span("page", "encode"):
+        pass
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="needs fork")
+def test_worker_forked_mid_emit_can_trace(tmp_path, monkeypatch):
+    monkeypatch.delenv(trace.TRACE_ENV, raising=False)
+    path = tmp_path / "trace.json"
+    trace.enable_trace(path)
+    try:
+        # As if another thread was writing a span at the moment of the fork
+        with trace._lock:
+            worker = multiprocessing.get_context("fork").Process(target=record_span)
+            worker.start()
+        worker.join(10)
+        if worker.is_alive():
+            worker.kill()
+        assert worker.exitcode == 0
+        trace.write_trace(path)
+    finally:
+        monkeypatch.delenv(trace.TRACE_ENV, raising=False)
+    events = json.loads(path.read_text())["traceEvents"]
+    assert any(e["name"] == "page" and e["pid"] == worker.pid for e in events)
@@ -0,0 +1,82 @@
+import zipfile
+
+import pytest
+
+from webp_converter.zipread import central_directory, extract_members, read_member
+
+PAGES = {
+    "p000.jpg": b"\xff\xd8" + bytes(range(256)) * 16,
+    "Über/p001.png": b"\x89PNG" + b"\x00" * 4096,
+    "ComicInfo.xml": b"<ComicInfo>" + b"words " * 1000 + b"</ComicInfo>",
+}
+
+
+def write_zip(path, compression=zipfile.ZIP_STORED):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, data in PAGES.items():
+            method = zipfile.ZIP_DEFLATED if name.endswith(".xml") else compression
+            archive.writestr(name, data, compress_type=method)
+
+
+def write_streamed_zip(path):
+    # Written to a pipe-like stream, zipfile falls back to data descriptors
+    class Unseekable:
+        def __init__(self, f):
+            self.f = f
+
+        def write(self, data):
+            return self.f.write(data)
+
+        def flush(self):
+            self.f.flush()
+
+    with open(path, "wb") as f:
+        with zipfile.ZipFile(Unseekable(f), "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, data in PAGES.items():
+                with archive.open(name, "w") as member:
+                    member.write(data)
+
+
+def read_all(path):
+    return {ref.name: read_member(path, ref) for ref in central_directory(path)}
+
+
+@pytest.mark.parametrize("compression", [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_read_member_round_trip(tmp_path, compression):
+    path = tmp_path / "comic.cbz"
+    write_zip(path, compression)
+    assert read_all(path) == PAGES
+
+
+def test_read_member_with_data_descriptors(tmp_path):
+    path = tmp_path / "comic.cbz"
+    write_streamed_zip(path)
+    with zipfile.ZipFile(path) as archive:
+        assert all(info.flag_bits & 0x08 for info in archive.infolist())
+    assert read_all(path) == PAGES
+
+
+def test_read_member_detects_crc_mismatch(tmp_path):
+    path = tmp_path / "comic.cbz"
+    write_zip(path)
+    ref = next(r for r in central_directory(path) if r.name == "p000.jpg")
+    raw = bytearray(path.read_bytes())
+    start = raw.index(PAGES["p000.jpg"])
+    raw[start + 100] ^= 0xFF
+    path.write_bytes(raw)
+    with pytest.raises(zipfile.BadZipFile, match="CRC mismatch"):
+        read_member(path, ref)
+
+
+def test_extract_members_flattens_names(tmp_path):
+    path = tmp_path / "comic.cbz"
+    write_zip(path, zipfile.ZIP_DEFLATED)
+    work_path = tmp_path / "work"
+    work_path.mkdir()
+    extract_members(path, work_path, jobs=2)
+    assert (work_path / "p001.png").read_bytes() == PAGES["Über/p001.png"]
+    assert sorted(p.name for p in work_path.iterdir()) == [
+        "ComicInfo.xml",
+        "p000.jpg",
+        "p001.png",
+    ]
@@ -0,0 +1,232 @@
+import json
+import os
+import pathlib
+import struct
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from .encoders import CODECS
+from .throttle import throttle
+from .trace import span
+from .utils import COMIC_EXT, ENCODED_EXT, IMAGE_EXT, STORED_EXT, console
+from .workdir import encoded_page, encoded_pages, list_images
+
+# Past these the classic zip format needs Zip64, which zipfile handles for us
+ZIP32_MAX_BYTES = 0xFFFF0000
+ZIP32_MAX_MEMBERS = 0xFFFF
+
+# Per-page codec choices, stored in the archive when several codecs compete
+MANIFEST_NAME = "codecs.json"
+
+
+def packed_pages(work_path):
+    """Converted pages plus any source page kept because it was smaller."""
+    pages = encoded_pages(work_path)
+    pages += [f for f in list_images(work_path) if not encoded_page(work_path, f)]
+    return sorted(pages)
+
+
+def page_manifest(pages):
+    """JSON for ``(source name, packed name, bytes)`` of every page.
+
+    A page packed under its own name was not encoded at all, whatever its
+    format, and is recorded as ``original``.
+    """
+    codecs = {suffix: codec for codec, suffix in CODECS.items()}
+    entries = {
+        packed: {
+            "source": source,
+            "codec": (
+                "original"
+                if source == packed
+                else codecs.get(pathlib.PurePosixPath(packed).suffix, "original")
+            ),
+            "bytes": size,
+        }
+        for source, packed, size in pages
+    }
+    return json.dumps({"pages": dict(sorted(entries.items()))}, indent=1)
+
+
+def prepare_member(member):
+    name, path = member
+    data = path.read_bytes()
+    method, payload = zipfile.ZIP_STORED, data
+    if path.suffix.lower() not in STORED_EXT:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+        packed = compressor.compress(data) + compressor.flush()
+        if len(packed) < len(data):
+            method, payload = zipfile.ZIP_DEFLATED, packed
+    throttle(len(data) + len(payload))
+    return name, zlib.crc32(data), len(data), method, payload
+
+
+def write_zip_members(out, members, jobs):
+    now = time.localtime()
+    dos_time = now.tm_hour << 11 | now.tm_min << 5 | now.tm_sec // 2
+    dos_date = (now.tm_year - 1980) << 9 | now.tm_mon << 5 | now.tm_mday
+    central = []
+
+    # zlib and file reads release the GIL, so threads compress in parallel;
+    # chunking keeps only a window of members in memory at once
+    chunk = (jobs or os.cpu_count() or 1) * 4
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for i in range(0, len(members), chunk):
+            for name, crc, size, method, payload in pool.map(
+                prepare_member, members[i : i + chunk]
+            ):
+                encoded = name.encode("utf-8")
+                flags = 0x800 if not name.isascii() else 0
+                offset = out.tell()
+                header = (20, flags, method, dos_time, dos_date, crc, len(payload))
+                out.write(
+                    struct.pack(
+                        "<IHHHHHIIIHH", 0x04034B50, *header, size, len(encoded), 0
+                    )
+                )
+                out.write(encoded)
+                out.write(payload)
+                central.append(
+                    struct.pack(
+                        "<IHHHHHHIIIHHHHHII",
+                        0x02014B50,
+                        3 << 8 | 20,  # made by Unix, zip 2.0
+                        *header[:5],
+                        crc,
+                        len(payload),
+                        size,
+                        len(encoded),
+                        0,
+                        0,
+                        0,
+                        0,
+                        0o644 << 16,
+                        offset,
+                    )
+                    + encoded
+                )
+
+    directory_offset = out.tell()
+    for entry in central:
+        out.write(entry)
+    directory_size = out.tell() - directory_offset
+    out.write(
+        struct.pack(
+            "<IHHHHIIH",
+            0x06054B50,
+            0,
+            0,
+            len(central),
+            len(central),
+            directory_size,
+            directory_offset,
+            0,
+        )
+    )
+
+
+def write_comic_zip(output_zip, members, jobs=None):
+    """Write ``(arcname, path)`` members to a zip, atomically.
+
+    Images are stored as-is; anything else is deflated in parallel. The
+    archive is built under a temporary name and renamed into place, so a
+    reader never sees a half-written CBZ.
+    """
+    output_zip = pathlib.Path(output_zip)
+    tmp = output_zip.with_name(f".{output_zip.name}.tmp")
+    total = sum(path.stat().st_size for _, path in members)
+    try:
+        if total >= ZIP32_MAX_BYTES or len(members) >= ZIP32_MAX_MEMBERS:
+            with zipfile.ZipFile(tmp, "w", allowZip64=True) as archive:
+                for name, path in members:
+                    method = (
+                        zipfile.ZIP_STORED
+                        if path.suffix.lower() in STORED_EXT
+                        else zipfile.ZIP_DEFLATED
+                    )
+                    throttle(path.stat().st_size * 2)
+                    archive.write(path, name, compress_type=method)
+        else:
+            with open(tmp, "wb") as out:
+                write_zip_members(out, members, jobs)
+        os.replace(tmp, output_zip)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def create_comic_archive(work_path, output_zip, jobs=None, manifest=False):
+    pages = packed_pages(work_path)
+    members = pages + sorted(work_path.glob("*.xml"))
+    if manifest:
+        sources = {f.stem: f.name for f in list_images(work_path)}
+        manifest_path = work_path / MANIFEST_NAME
+        manifest_path.write_text(
+            page_manifest(
+                (sources.get(p.stem, p.name), p.name, p.stat().st_size) for p in pages
+            )
+        )
+        members.append(manifest_path)
+    with span("pack", "archive", archive=pathlib.Path(output_zip).name):
+        write_comic_zip(output_zip, [(p.name, p) for p in members], jobs)
+
+
+def output_path(file, in_place=False):
+    """Where the converted archive for ``file`` ends up.
+
+    In place (how mylar runs the post-processing script) the source is
+    replaced by a ``.cbz`` of the same name; otherwise ``.cbz`` is appended
+    and the source is left alone.
+    """
+    file = pathlib.Path(file)
+    return file.with_suffix(".cbz") if in_place else pathlib.Path(f"{file}.cbz")
+
+
+def is_output(path, in_place=False):
+    """Whether ``path`` is the converted archive of a comic next to it.
+
+    Picking those up again would stack up ``name.cbz.cbz.cbz``.
+    """
+    path = pathlib.Path(path)
+    source = path.with_name(path.stem)
+    return source.suffix.lower() in COMIC_EXT and output_path(source, in_place) == path
+
+
+def staging_path(output_zip):
+    # Converted archives land here first so they can be checked against the
+    # source before anything is overwritten
+    output_zip = pathlib.Path(output_zip)
+    return output_zip.with_name(f".{output_zip.name}.new")
+
+
+def page_count(path):
+    with zipfile.ZipFile(path) as archive:
+        return sum(
+            pathlib.PurePosixPath(name).suffix.lower() in IMAGE_EXT | ENCODED_EXT
+            for name in archive.namelist()
+        )
+
+
+def finalize_archive(source, output_zip, keep_smaller=True, in_place=False):
+    """Move a staged archive into place, unless it is bigger than the source.
+
+    Returns False if the converted archive was discarded. A staged archive
+    without any pages is always an error, never a small conversion.
+    """
+    staged = staging_path(output_zip)
+    if not page_count(staged):
+        staged.unlink()
+        raise ValueError(f"Converted archive for {source.name} has no pages")
+    if keep_smaller and staged.stat().st_size >= source.stat().st_size:
+        staged.unlink()
+        console.print(
+            f"[yellow]Converted archive is larger than {source.name}, "
+            f"keeping the original[/yellow]"
+        )
+        return False
+    os.replace(staged, output_zip)
+    if in_place and output_zip != source:
+        source.unlink()
+    console.print(f"[green]Created {output_zip}[/green]")
+    return True
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+
+
+class PageCache:
+    """Content-addressed store of encoded pages, capped in size.
+
+    Entries are keyed by the source page hash plus the encoder settings, so
+    a page shared between archives is only ever encoded once per setting.
+    When the cache grows past ``max_bytes`` the least recently used entries
+    are evicted.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.root / "index.db", check_same_thread=False)
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                size INTEGER,
+                last_used REAL
+            )"""
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS lru ON pages (last_used)")
+        self.db.commit()
+        self.total = self.db.execute("SELECT SUM(size) FROM pages").fetchone()[0] or 0
+
+    def key(self, digest, options):
+        return hashlib.sha256(f"{digest}:{options.cache_key}".encode()).hexdigest()
+
+    def path(self, key):
+        return self.root / key[:2] / f"{key}.webp"
+
+    def get(self, key):
+        path = self.path(key)
+        with self.lock:
+            found = self.db.execute(
+                "UPDATE pages SET last_used = ? WHERE key = ?", (time.time(), key)
+            ).rowcount
+            self.db.commit()
+        if found and path.exists():
+            return path
+        return None
+
+    def put(self, key, data):
+        path = self.path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        with self.lock:
+            row = self.db.execute(
+                "SELECT size FROM pages WHERE key = ?", (key,)
+            ).fetchone()
+            self.total += len(data) - (row[0] if row else 0)
+            self.db.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?)",
+                (key, len(data), time.time()),
+            )
+            self.evict()
+            self.db.commit()
+
+    def evict(self):
+        while self.total > self.max_bytes:
+            rows = self.db.execute(
+                "SELECT key, size FROM pages ORDER BY last_used LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            evicted = []
+            for key, size in rows:
+                if self.total <= self.max_bytes:
+                    break
+                self.path(key).unlink(missing_ok=True)
+                self.total -= size
+                evicted.append((key,))
+            self.db.executemany("DELETE FROM pages WHERE key = ?", evicted)
+
+    def close(self):
+        self.db.close()
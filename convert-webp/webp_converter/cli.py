@@ -0,0 +1,351 @@
+import argparse
+import os
+import pathlib
+import sys
+
+from .cache import PageCache
+from .detect import probe_archives
+from .encoders import (
+    CODECS,
+    DEVICE_PROFILES,
+    ENCODERS,
+    HAS_NUMPY,
+    HAS_PILLOW,
+    EncodeOptions,
+    available_codecs,
+    calibrate_encoders,
+    resolve_encoder,
+)
+from .estimate import estimate_library, load_rates, print_estimate, save_rates
+from .inventory import LibraryInventory, print_inventory_report
+from .ledger import ConversionLedger
+from .metrics import RunMetrics
+from .pipeline import find_comics, process_comic
+from .scheduler import LibraryScheduler
+from .throttle import LoadGovernor, limit_bandwidth, lower_priority
+from .thumbnails import ThumbnailOptions, parse_sizes
+from .trace import enable_trace, write_trace
+from .utils import console, logger
+from .watch import WatchFolder
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert comic book archives to WebP format."
+    )
+    parser.add_argument(
+        "files", nargs="*", help="Comic files or directories to convert."
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Total worker budget shared by all archives (default: CPU count).",
+    )
+    parser.add_argument(
+        "-a",
+        "--archives",
+        type=int,
+        default=None,
+        help="Number of archives to convert at once (default: jobs / 2, max 4).",
+    )
+    parser.add_argument(
+        "-e",
+        "--encoder",
+        choices=["auto", *ENCODERS],
+        default="auto",
+        help="WebP encoder backend (default: fastest on this host, see --calibrate).",
+    )
+    parser.add_argument(
+        "--calibrate",
+        action="store_true",
+        help="Re-time the encoder backends on this host, then exit.",
+    )
+    parser.add_argument(
+        "-s",
+        "--stream",
+        action="store_true",
+        help="Convert CBZ files in memory without a work directory.",
+    )
+    parser.add_argument(
+        "--probe",
+        action="store_true",
+        help="Only report the archive type of every file, then exit.",
+    )
+    parser.add_argument(
+        "--inventory",
+        metavar="DB",
+        help="Index pages of every archive into this SQLite file from the "
+        "archive headers only, report what is left to convert, then exit.",
+    )
+    parser.add_argument(
+        "--estimate",
+        action="store_true",
+        help="Dry run: encode a random sample of pages, extrapolate time and "
+        "savings per directory, then exit.",
+    )
+    parser.add_argument(
+        "--sample",
+        type=int,
+        default=300,
+        help="Pages to encode for --estimate (default: 300).",
+    )
+    parser.add_argument(
+        "--rates",
+        default="webp_rates.json",
+        help="Where --estimate saves its per-page rates, which later runs use "
+        "for the progress ETA (default: webp_rates.json).",
+    )
+    parser.add_argument(
+        "--ledger",
+        default="webp_ledger.db",
+        help="SQLite ledger of converted archives (default: webp_ledger.db).",
+    )
+    parser.add_argument(
+        "--no-ledger",
+        action="store_true",
+        help="Don't read or update the ledger.",
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="Convert archives even if the ledger says they are done.",
+    )
+    parser.add_argument(
+        "-q",
+        "--quality",
+        type=int,
+        default=80,
+        help="Fixed WebP quality when no target is given (default: 80).",
+    )
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument(
+        "--target-ssim",
+        type=float,
+        help="Pick the lowest quality per page that reaches this SSIM (e.g. 0.97).",
+    )
+    target.add_argument(
+        "--target-kb",
+        type=int,
+        help="Pick the highest quality per page that fits in this many KiB.",
+    )
+    parser.add_argument(
+        "-p",
+        "--profile",
+        choices=DEVICE_PROFILES,
+        help="Shrink pages to fit this reader's screen (grayscale for e-ink).",
+    )
+    parser.add_argument(
+        "-c",
+        "--codecs",
+        type=lambda text: tuple(c.strip().lower() for c in text.split(",")),
+        default=(),
+        help="Encode every page in each of these codecs (webp, avif, jxl) "
+        "and keep the smallest; the choices go into codecs.json in the archive.",
+    )
+    parser.add_argument(
+        "-b",
+        "--background",
+        action="store_true",
+        help="Run at low CPU and I/O priority and shed workers when the host "
+        "is loaded or short on memory.",
+    )
+    parser.add_argument(
+        "--bandwidth-mb",
+        type=float,
+        help="Cap archive reads and writes at this many MB/s in total.",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="Record every extract, decode, encode and pack span as a Chrome "
+        "trace-event JSON file for Perfetto.",
+    )
+    parser.add_argument(
+        "--thumbnails",
+        metavar="DIR",
+        help="Write cover thumbnails into DIR, keyed by the SHA-256 of the "
+        "finished archive, from the cover page the encoder already decoded.",
+    )
+    parser.add_argument(
+        "--thumb-sizes",
+        type=parse_sizes,
+        default="300x450",
+        help="Comma-separated WxH boxes for --thumbnails (default: 300x450).",
+    )
+    parser.add_argument(
+        "--metrics-jsonl",
+        help="Append per-stage and per-archive metrics to this JSON lines file.",
+    )
+    parser.add_argument(
+        "--metrics-prom",
+        help="Keep a Prometheus textfile-collector file (*.prom) up to date.",
+    )
+    parser.add_argument(
+        "--page-cache",
+        help="Directory for a content-addressed cache of encoded pages.",
+    )
+    parser.add_argument(
+        "--page-cache-gb",
+        type=float,
+        default=10,
+        help="Evict least recently used pages past this size (default: 10).",
+    )
+    parser.add_argument(
+        "--allow-growth",
+        action="store_true",
+        help="Keep WebP pages and archives even when they are larger.",
+    )
+    parser.add_argument(
+        "-w",
+        "--watch",
+        metavar="INBOX",
+        help="Keep running and convert archives as they land in INBOX.",
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=10.0,
+        help="Seconds a new file must stay unchanged before it is queued.",
+    )
+    parser.add_argument(
+        "--status-file",
+        help="Watch mode: keep queue length and throughput in this JSON file.",
+    )
+    args = parser.parse_args()
+
+    if args.calibrate:
+        console.print(f"Fastest encoder: {calibrate_encoders()}")
+        return
+    if not args.files and not args.watch:
+        parser.error("give comic files/directories or --watch INBOX")
+    if (args.target_ssim or args.target_kb) and not HAS_PILLOW:
+        parser.error("adaptive quality needs Pillow with WebP support")
+    if args.target_ssim and not HAS_NUMPY:
+        parser.error("--target-ssim needs numpy")
+    if args.profile and not HAS_PILLOW:
+        parser.error("device profiles need Pillow to read page sizes")
+    unknown = [c for c in args.codecs if c not in CODECS]
+    if unknown:
+        parser.error(f"unknown codecs: {', '.join(unknown)}")
+    missing = [c for c in args.codecs if c not in available_codecs()]
+    if missing:
+        parser.error(f"no encoder found for: {', '.join(missing)}")
+    if args.thumbnails and not HAS_PILLOW:
+        parser.error("--thumbnails needs Pillow with WebP support")
+
+    if args.probe:
+        results = probe_archives(args.files, args.jobs)
+        for path, filetype in sorted(results.items()):
+            console.print(f"{filetype or '[red]unknown[/red]'}\t{path}")
+        return
+
+    if args.background:
+        lower_priority()
+    if args.bandwidth_mb:
+        limit_bandwidth(int(args.bandwidth_mb * 2**20))
+
+    if args.inventory:
+        inventory = LibraryInventory(args.inventory)
+        try:
+            inventory.update(find_comics(args.files), args.jobs)
+            print_inventory_report(inventory)
+        finally:
+            inventory.close()
+        return
+
+    options = EncodeOptions(
+        encoder=resolve_encoder(args.encoder),
+        quality=args.quality,
+        target_ssim=args.target_ssim,
+        target_bytes=args.target_kb * 1024 if args.target_kb else None,
+        keep_smaller=not args.allow_growth,
+        profile=DEVICE_PROFILES.get(args.profile),
+        codecs=args.codecs,
+    )
+    if options.profile and options.profile.grayscale and options.encoder == "cwebp":
+        logger.warning("cwebp can't write grayscale pages, only resizing them")
+
+    if args.estimate:
+        estimate = estimate_library(
+            find_comics(args.files), options, args.sample, args.jobs
+        )
+        if not estimate:
+            console.print("[red]No convertible pages found[/red]")
+            return
+        print_estimate(estimate)
+        save_rates(args.rates, estimate.rates(options))
+        return
+
+    ledger = None if args.no_ledger else ConversionLedger(args.ledger)
+    cache = (
+        PageCache(args.page_cache, int(args.page_cache_gb * 2**30))
+        if args.page_cache
+        else None
+    )
+    scheduler = LibraryScheduler(
+        jobs=args.jobs,
+        archives=args.archives,
+        options=options,
+        stream=args.stream,
+        ledger=ledger,
+        force=args.force,
+        metrics=RunMetrics(args.metrics_jsonl, args.metrics_prom),
+        cache=cache,
+        rates=load_rates(args.rates, options),
+        thumbnails=(
+            ThumbnailOptions(args.thumbnails, args.thumb_sizes)
+            if args.thumbnails
+            else None
+        ),
+    )
+    if args.trace:
+        # Before the pools start, so every worker inherits it
+        enable_trace(args.trace)
+    governor = LoadGovernor(scheduler.budget, scheduler.jobs)
+    if args.background:
+        governor.start()
+    try:
+        if args.watch:
+            WatchFolder(args.watch, scheduler, args.settle, args.status_file).run()
+        else:
+            scheduler.run(find_comics(args.files))
+    finally:
+        governor.stop()
+        if args.trace:
+            write_trace(args.trace)
+        if ledger:
+            ledger.close()
+        if cache:
+            cache.close()
+
+
+def mylar_main(default_root):
+    """Entry point for the mylar post-processing scripts.
+
+    mylar passes the downloaded archive as the fourth argument. It is
+    converted in place, with work directories under ``$C2W_PATH/work``.
+    ``$C2W_PROFILE`` names a device profile to shrink pages to, and a set
+    ``$C2W_BACKGROUND`` runs the conversion at low CPU and I/O priority.
+    ``$C2W_THUMBNAILS`` names a directory for cover thumbnails and
+    ``$C2W_CODECS`` a comma-separated list of codecs to pick from per page.
+    """
+    if os.getenv("C2W_BACKGROUND"):
+        lower_priority()
+    comic = pathlib.Path(sys.argv[4])
+    work_root = pathlib.Path(os.getenv("C2W_PATH", default_root)) / "work"
+    options = EncodeOptions(
+        resolve_encoder(os.getenv("C2W_ENCODER", "auto")),
+        profile=DEVICE_PROFILES.get(os.getenv("C2W_PROFILE", "")),
+        codecs=tuple(c for c in os.getenv("C2W_CODECS", "").split(",") if c in CODECS),
+    )
+    thumbnails = os.getenv("C2W_THUMBNAILS")
+    process_comic(
+        comic,
+        options=options,
+        in_place=True,
+        work_root=work_root,
+        thumbnails=ThumbnailOptions(thumbnails) if thumbnails else None,
+    )
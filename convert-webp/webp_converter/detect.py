@@ -0,0 +1,74 @@
+import pathlib
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from .utils import ENCODED_EXT, IMAGE_EXT, logger
+
+# Leading bytes of each archive format, checked longest first
+ARCHIVE_SIGNATURES = [
+    (b"Rar!\x1a\x07\x01\x00", "rar"),  # RAR5
+    (b"Rar!\x1a\x07\x00", "rar"),  # RAR4
+    (b"7z\xbc\xaf\x27\x1c", "7z"),
+    (b"PK\x03\x04", "zip"),
+    (b"PK\x05\x06", "zip"),  # empty archive
+    (b"PK\x07\x08", "zip"),  # spanned archive
+]
+
+# Leading bytes of each encoded page format, for pages read back from a cache
+PAGE_SIGNATURES = [
+    (0, b"\x00\x00\x00\x0cJXL \r\n\x87\n", ".jxl"),  # ISOBMFF container
+    (0, b"\xff\x0a", ".jxl"),  # bare codestream
+    (4, b"ftypavif", ".avif"),
+    (8, b"WEBP", ".webp"),
+]
+
+
+def get_file_mime_type(comic_file):
+    try:
+        with open(comic_file, "rb") as f:
+            header = f.read(512)
+    except OSError as e:
+        logger.error(f"Failed to detect archive type for {comic_file}: {e}")
+        return None
+
+    for signature, filetype in ARCHIVE_SIGNATURES:
+        if header.startswith(signature):
+            return filetype
+    if header[257:262] == b"ustar":
+        return "tar"
+    return None
+
+
+def probe_archives(paths, jobs=None):
+    """Classify every file under ``paths`` by magic bytes.
+
+    Returns a ``{path: type}`` dict where type is one of zip, rar, 7z, tar or
+    None for anything unrecognised.
+    """
+    files = []
+    for item in paths:
+        path = pathlib.Path(item)
+        if path.is_dir():
+            files.extend(p for p in path.rglob("*") if p.is_file())
+        else:
+            files.append(path)
+
+    # Header reads are I/O bound, so threads are enough
+    with ThreadPoolExecutor(max_workers=jobs or 32) as pool:
+        return dict(zip(files, pool.map(get_file_mime_type, files)))
+
+
+def encoded_suffix(data):
+    """File suffix for an encoded page, sniffed from its leading bytes."""
+    for offset, signature, suffix in PAGE_SIGNATURES:
+        if data[offset : offset + len(signature)] == signature:
+            return suffix
+    return ".webp"
+
+
+def is_webp_only(file):
+    if get_file_mime_type(file) != "zip":
+        return False
+    with zipfile.ZipFile(file) as archive:
+        suffixes = {pathlib.PurePosixPath(n).suffix.lower() for n in archive.namelist()}
+    return bool(suffixes & ENCODED_EXT) and not suffixes & IMAGE_EXT
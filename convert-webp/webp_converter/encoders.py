@@ -0,0 +1,562 @@
+import io
+import json
+import os
+import pathlib
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from .thumbnails import thumbnails_from_source, write_thumbnails
+from .trace import span
+from .utils import console, logger
+
+try:
+    import PIL
+    from PIL import Image, ImageDraw, features
+
+    HAS_PILLOW = features.check("webp")
+    HAS_AVIF = features.check("avif")
+    PIL_VERSION = PIL.__version__
+except ImportError:
+    HAS_PILLOW = False
+    HAS_AVIF = False
+    PIL_VERSION = None
+
+try:
+    import numpy
+
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# Bounds for the adaptive quality search
+QUALITY_MIN = 30
+QUALITY_MAX = 95
+
+# Codecs a page can be written in, with the suffix of the result
+CODECS = {"webp": ".webp", "avif": ".avif", "jxl": ".jxl"}
+
+# Per-host timings of the encoder backends, see calibrate_encoders()
+CALIBRATION_FILE = pathlib.Path(
+    os.getenv("C2W_CALIBRATION", "~/.cache/webp_converter/calibration.json")
+).expanduser()
+
+
+@dataclass(frozen=True)
+class DeviceProfile:
+    """Largest page a reader can show; bigger pages are shrunk to fit."""
+
+    width: int
+    height: int
+    grayscale: bool = False
+
+    @property
+    def key(self):
+        return f"{self.width}x{self.height}{'-gray' if self.grayscale else ''}"
+
+    def fit(self, size):
+        scale = min(self.width / size[0], self.height / size[1], 1)
+        return round(size[0] * scale), round(size[1] * scale)
+
+
+DEVICE_PROFILES = {
+    "kindle": DeviceProfile(1072, 1448, grayscale=True),
+    "kindle-scribe": DeviceProfile(1860, 2480, grayscale=True),
+    "kobo-clara": DeviceProfile(1072, 1448, grayscale=True),
+    "kobo-sage": DeviceProfile(1440, 1920, grayscale=True),
+    "kobo-colour": DeviceProfile(1072, 1448),
+    "tablet": DeviceProfile(1600, 2560),
+    "ipad": DeviceProfile(2048, 2732),
+}
+
+
+@dataclass(frozen=True)
+class EncodeOptions:
+    encoder: str = "cwebp"
+    quality: int = 80
+    target_ssim: float = None
+    target_bytes: int = None
+    keep_smaller: bool = True
+    profile: DeviceProfile = None
+    codecs: tuple = ()
+
+    @property
+    def adaptive(self):
+        return self.target_ssim is not None or self.target_bytes is not None
+
+    @property
+    def target_key(self):
+        if self.target_ssim is not None:
+            target = f"ssim:{self.target_ssim}"
+        else:
+            target = f"bytes:{self.target_bytes}"
+        # A downscaled page needs its own quality, not the full-size one
+        return f"{target}:{self.profile.key}" if self.profile else target
+
+    @property
+    def cache_key(self):
+        target = self.target_key if self.adaptive else f"q:{self.quality}"
+        if self.profile and not self.adaptive:
+            target = f"{target}:{self.profile.key}"
+        if self.codecs:
+            target = f"{target}:{'+'.join(self.codecs)}"
+        return f"{self.encoder}:{target}"
+
+
+def ssim(a, b):
+    """Mean SSIM of two same-sized grayscale images over 8x8 blocks."""
+    x = numpy.asarray(a, dtype=numpy.float64)
+    y = numpy.asarray(b, dtype=numpy.float64)
+    h, w = x.shape[0] // 8 * 8, x.shape[1] // 8 * 8
+    x = x[:h, :w].reshape(h // 8, 8, w // 8, 8)
+    y = y[:h, :w].reshape(h // 8, 8, w // 8, 8)
+    mx, my = x.mean(axis=(1, 3)), y.mean(axis=(1, 3))
+    vx, vy = x.var(axis=(1, 3)), y.var(axis=(1, 3))
+    cov = ((x - mx[:, None, :, None]) * (y - my[:, None, :, None])).mean(axis=(1, 3))
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    score = ((2 * mx * my + c1) * (2 * cov + c2)) / (
+        (mx**2 + my**2 + c1) * (vx + vy + c2)
+    )
+    return float(score.mean())
+
+
+def open_page(source, profile=None, thumbnails=None):
+    """Open a page for encoding, already shrunk to ``profile`` if one is given.
+
+    JPEGs are decoded in draft mode, so libjpeg scales them down by 1/2, 1/4
+    or 1/8 while decoding and the full-size bitmap is never built. With
+    ``thumbnails`` the covers are cut from the decoded page before the
+    profile makes it gray or smaller.
+    """
+    image = Image.open(source)
+    target = None
+    if profile and not getattr(image, "is_animated", False):
+        target = profile.fit(image.size)
+        if target == image.size and not profile.grayscale:
+            target = None
+    if target and image.format == "JPEG":
+        grayscale = profile.grayscale and not thumbnails
+        image.draft("L" if grayscale else "RGB", target)
+    if thumbnails:
+        with span("thumbnails", "encode"):
+            image.load()
+            write_thumbnails(image, thumbnails)
+    if not target:
+        return image
+    if profile.grayscale:
+        image = image.convert("L")
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    image.thumbnail(target, Image.LANCZOS)
+    return image
+
+
+def search_quality(source, options):
+    """Binary search the WebP quality for one page.
+
+    With a target SSIM this is the lowest quality that still reaches it;
+    with a byte budget it is the highest quality that fits.
+    """
+    with span("quality search", "encode"), open_page(source, options.profile) as image:
+        if getattr(image, "is_animated", False):
+            return options.quality
+        # Detach from the file before the with block closes it
+        if image.mode == "L":
+            image = image.copy()
+        else:
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    reference = image.convert("L") if options.target_ssim is not None else None
+
+    lo, hi = QUALITY_MIN, QUALITY_MAX
+    best = QUALITY_MAX if reference else QUALITY_MIN
+    while lo <= hi:
+        quality = (lo + hi) // 2
+        out = io.BytesIO()
+        image.save(out, "WEBP", quality=quality)
+        if reference:
+            with Image.open(out) as encoded:
+                ok = ssim(reference, encoded.convert("L")) >= options.target_ssim
+            if ok:
+                best, hi = quality, quality - 1
+            else:
+                lo = quality + 1
+        elif out.tell() <= options.target_bytes:
+            best, lo = quality, quality + 1
+        else:
+            hi = quality - 1
+    return best
+
+
+def resize_args(source, profile):
+    # cwebp can scale but not fit to a box, so size it from the page header
+    if not profile or not HAS_PILLOW:
+        return []
+    with Image.open(source) as image:
+        target = profile.fit(image.size)
+        if target == image.size:
+            return []
+    return ["-resize", str(target[0]), str(target[1])]
+
+
+def encode_with_cli(file, out_path, quality=80, profile=None, thumbnails=None):
+    if thumbnails:
+        # cwebp decodes the page on its own, so the cover costs one more decode
+        with span("thumbnails", "decode", page=file.name):
+            thumbnails_from_source(file, thumbnails)
+    if file.suffix.lower() == ".gif":
+        command = ["gif2webp", "-q", str(quality)]
+    else:
+        command = ["cwebp", "-q", str(quality), *resize_args(file, profile)]
+    with span(command[0], "encode", page=file.name):
+        subprocess.run(
+            [*command, "-o", str(out_path), "--", str(file)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+
+
+def encode_with_pillow(file, out_path, quality=80, profile=None, thumbnails=None):
+    page = getattr(file, "name", "page")
+    with span("decode", "decode", page=page):
+        image = open_page(file, profile, thumbnails)
+        image.load()
+    with image, span("encode", "encode", page=page):
+        animated = getattr(image, "is_animated", False)
+        if image.mode not in ("RGB", "RGBA", "L") and not animated:
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        image.save(out_path, "WEBP", quality=quality, save_all=animated)
+
+
+def encode_bytes_with_cli(data, suffix, quality=80, profile=None, thumbnails=None):
+    if thumbnails:
+        with span("thumbnails", "decode"):
+            thumbnails_from_source(data, thumbnails)
+    if suffix == ".gif":
+        # gif2webp can't read from a pipe, so spool animated pages to disk
+        with tempfile.TemporaryDirectory() as tmp:
+            src = pathlib.Path(tmp) / "page.gif"
+            out = pathlib.Path(tmp) / "page.webp"
+            src.write_bytes(data)
+            encode_with_cli(src, out, quality)
+            return out.read_bytes()
+    resize = resize_args(io.BytesIO(data), profile)
+    with span("cwebp", "encode"):
+        result = subprocess.run(
+            ["cwebp", "-quiet", "-q", str(quality), *resize, "-o", "-", "--", "-"],
+            input=data,
+            capture_output=True,
+            check=True,
+        )
+    return result.stdout
+
+
+def encode_bytes_with_pillow(data, suffix, quality=80, profile=None, thumbnails=None):
+    out = io.BytesIO()
+    encode_with_pillow(io.BytesIO(data), out, quality, profile, thumbnails)
+    return out.getvalue()
+
+
+def fitted_source(data, suffix, profile):
+    # For CLI encoders that can't fit a page to a box themselves
+    if not profile or not HAS_PILLOW:
+        return data, suffix
+    with Image.open(io.BytesIO(data)) as image:
+        if profile.fit(image.size) == image.size and not profile.grayscale:
+            return data, suffix
+    with open_page(io.BytesIO(data), profile) as image:
+        out = io.BytesIO()
+        image.save(out, "PNG")
+    return out.getvalue(), ".png"
+
+
+def run_file_encoder(command, data, suffix, out_suffix):
+    with tempfile.TemporaryDirectory() as tmp:
+        src = pathlib.Path(tmp) / f"page{suffix}"
+        out = pathlib.Path(tmp) / f"page{out_suffix}"
+        src.write_bytes(data)
+        with span(command[0], "encode"):
+            subprocess.run(
+                [*command, str(src), str(out)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                check=True,
+            )
+        return out.read_bytes()
+
+
+def encode_avif(data, suffix, quality=80, profile=None):
+    if not HAS_AVIF:
+        data, suffix = fitted_source(data, suffix, profile)
+        # One thread per page: the worker budget already spreads pages over cores
+        return run_file_encoder(
+            ["avifenc", "-j", "1", "-q", str(quality)], data, suffix, ".avif"
+        )
+    with span("decode", "decode"), open_page(io.BytesIO(data), profile) as image:
+        image.load()
+        if image.mode not in ("RGB", "RGBA", "L"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        out = io.BytesIO()
+        with span("avif", "encode"):
+            image.save(out, "AVIF", quality=quality, max_threads=1)
+    return out.getvalue()
+
+
+def encode_jxl(data, suffix, quality=80, profile=None):
+    # Always lossless: JPEGs are recompressed bit-exactly, so no quality applies
+    data, suffix = fitted_source(data, suffix, profile)
+    return run_file_encoder(
+        ["cjxl", "-d", "0", "--num_threads=1"], data, suffix, ".jxl"
+    )
+
+
+CODEC_ENCODERS = {
+    "avif": encode_avif,
+    "jxl": encode_jxl,
+}
+
+ENCODERS = {
+    "cwebp": encode_with_cli,
+    "pillow": encode_with_pillow,
+}
+
+BYTE_ENCODERS = {
+    "cwebp": encode_bytes_with_cli,
+    "pillow": encode_bytes_with_pillow,
+}
+
+
+def available_encoders():
+    found = []
+    if HAS_PILLOW:
+        found.append("pillow")
+    if shutil.which("cwebp"):
+        found.append("cwebp")
+    return found
+
+
+def available_codecs():
+    found = ["webp"]
+    if HAS_AVIF or shutil.which("avifenc"):
+        found.append("avif")
+    if shutil.which("cjxl"):
+        found.append("jxl")
+    return found
+
+
+def calibration_page(size=(1600, 2400)):
+    # Flat panels over noise, roughly how a scanned page compresses
+    image = Image.effect_noise(size, 32).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for i in range(24):
+        x, y = i * 61 % size[0], i * 97 % size[1]
+        draw.rectangle([x, y, x + 300, y + 400], fill=(i * 10, 255 - i * 10, 128))
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+def calibration_host():
+    """What the stored timings depend on; a change forces a new calibration."""
+    return {
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "pillow": PIL_VERSION,
+        "cwebp": shutil.which("cwebp"),
+    }
+
+
+def calibrate_encoders(path=CALIBRATION_FILE, rounds=3):
+    """Time every available backend on a synthetic page and store the result.
+
+    Returns the name of the fastest backend.
+    """
+    encoders = available_encoders()
+    if len(encoders) < 2:
+        return encoders[0] if encoders else "cwebp"
+
+    data = calibration_page()
+    timings = {}
+    for name in encoders:
+        best = None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            try:
+                BYTE_ENCODERS[name](data, ".jpg")
+            except Exception as e:
+                logger.warning(f"Calibration of {name} failed: {e}")
+                break
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        if best is not None:
+            timings[name] = best
+    if not timings:
+        return "cwebp"
+
+    fastest = min(timings, key=timings.get)
+    saved = {"host": calibration_host(), "timings": timings, "fastest": fastest}
+    try:
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(saved, indent=4))
+    except OSError as e:
+        logger.warning(f"Could not save encoder calibration: {e}")
+    console.print(
+        "[dim]Calibrated encoders: "
+        + ", ".join(f"{n} {t * 1000:.0f} ms/page" for n, t in timings.items())
+        + f", using {fastest}[/dim]"
+    )
+    return fastest
+
+
+def calibrated_encoder(path=CALIBRATION_FILE):
+    try:
+        saved = json.loads(pathlib.Path(path).read_text())
+    except (OSError, json.JSONDecodeError):
+        return calibrate_encoders(path)
+    stale = saved.get("host") != calibration_host()
+    if stale or saved.get("fastest") not in available_encoders():
+        return calibrate_encoders(path)
+    return saved["fastest"]
+
+
+def resolve_encoder(name="auto"):
+    if name == "auto":
+        return calibrated_encoder()
+    if name == "pillow" and not HAS_PILLOW:
+        logger.warning("Pillow with WebP support not found, falling back to cwebp")
+        return "cwebp"
+    return name
+
+
+def encode_page(file, out_path, options, quality=None, thumbnails=None):
+    """Encode one page; ``thumbnails`` asks for cover thumbnails cut from it.
+
+    With several codecs the page is written next to ``out_path`` with the
+    suffix of whichever codec won.
+    """
+    start = time.perf_counter()
+    if options.codecs and file.suffix.lower() != ".gif":
+        _, out_name, payload, encoder, quality, _ = encode_member(
+            file.name, file.read_bytes(), options, quality, thumbnails
+        )
+        if encoder != "original":
+            out_path.with_name(out_name).write_bytes(payload)
+        return file, encoder, quality, time.perf_counter() - start
+    if quality is None:
+        quality = search_quality(file, options) if options.adaptive else options.quality
+    encoder = options.encoder
+    try:
+        ENCODERS[encoder](file, out_path, quality, options.profile, thumbnails)
+    except Exception as e:
+        if encoder == "cwebp":
+            raise
+        # Anything the library can't handle still gets a shot at the CLI tools
+        logger.debug(f"{encoder} failed on {file.name} ({e}), retrying with cwebp")
+        encoder = "cwebp"
+        if thumbnails and thumbnails.done():
+            thumbnails = None
+        encode_with_cli(file, out_path, quality, options.profile, thumbnails)
+    if options.keep_smaller and out_path.stat().st_size >= file.stat().st_size:
+        # WebP came out bigger, so drop it and pack the source page as-is
+        out_path.unlink()
+        encoder = "original"
+    return file, encoder, quality, time.perf_counter() - start
+
+
+def encode_webp(name, data, suffix, quality, options, thumbnails=None):
+    encoder = options.encoder
+    try:
+        webp = BYTE_ENCODERS[encoder](
+            data, suffix, quality, options.profile, thumbnails
+        )
+    except Exception as e:
+        if encoder == "cwebp":
+            raise
+        logger.debug(f"{encoder} failed on {name} ({e}), retrying with cwebp")
+        encoder = "cwebp"
+        if thumbnails and thumbnails.done():
+            thumbnails = None
+        webp = encode_bytes_with_cli(data, suffix, quality, options.profile, thumbnails)
+    return webp, encoder
+
+
+def within_bound(reference, payload, options):
+    if options.target_bytes is not None and len(payload) > options.target_bytes:
+        return False
+    if reference is None:
+        return True
+    with Image.open(io.BytesIO(payload)) as encoded:
+        return ssim(reference, encoded.convert("L")) >= options.target_ssim
+
+
+def encode_codecs(name, data, suffix, quality, options, thumbnails=None):
+    """Encode a page in every codec of ``options.codecs`` at once.
+
+    The smallest result wins, as long as it still meets the target SSIM or
+    byte budget when one is set. WebP went through the quality search, and
+    lossless JPEG XL can't lose anything, so only AVIF, which just borrows
+    the WebP quality, needs checking. Returns the payload, the encoder that
+    made it and its suffix.
+    """
+    with ThreadPoolExecutor(max_workers=len(options.codecs)) as pool:
+        futures = {}
+        for codec in options.codecs:
+            if codec == "webp":
+                futures[codec] = pool.submit(
+                    encode_webp, name, data, suffix, quality, options, thumbnails
+                )
+            else:
+                futures[codec] = pool.submit(
+                    CODEC_ENCODERS[codec], data, suffix, quality, options.profile
+                )
+    reference = None
+    if options.target_ssim is not None and "avif" in futures:
+        with open_page(io.BytesIO(data), options.profile) as image:
+            reference = image.convert("L")
+
+    best = None
+    for codec, future in futures.items():
+        try:
+            if codec == "webp":
+                payload, encoder = future.result()
+            else:
+                payload, encoder = future.result(), codec
+            if codec == "avif" and not within_bound(reference, payload, options):
+                logger.debug(f"avif misses the target SSIM on {name}")
+                continue
+        except Exception as e:
+            logger.debug(f"{codec} failed on {name}: {e}")
+            continue
+        if best is None or len(payload) < len(best[0]):
+            best = payload, encoder, CODECS[codec]
+    if best is None:
+        raise RuntimeError(f"no codec could encode {name}")
+    return best
+
+
+def encode_member(name, data, options, quality=None, thumbnails=None):
+    start = time.perf_counter()
+    suffix = pathlib.PurePosixPath(name).suffix.lower()
+    if quality is None:
+        quality = (
+            search_quality(io.BytesIO(data), options)
+            if options.adaptive
+            else options.quality
+        )
+    if options.codecs and suffix != ".gif":
+        payload, encoder, out_suffix = encode_codecs(
+            name, data, suffix, quality, options, thumbnails
+        )
+    else:
+        # Animated pages only have WebP to go to
+        payload, encoder = encode_webp(name, data, suffix, quality, options, thumbnails)
+        out_suffix = ".webp"
+    out_name = f"{pathlib.PurePosixPath(name).stem}{out_suffix}"
+    if options.keep_smaller and len(payload) >= len(data):
+        out_name, payload, encoder = pathlib.PurePosixPath(name).name, data, "original"
+    return name, out_name, payload, encoder, quality, time.perf_counter() - start
@@ -0,0 +1,211 @@
+import json
+import math
+import os
+import pathlib
+import random
+import subprocess
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from rich.progress import Progress
+from rich.table import Table
+
+from .encoders import encode_member
+from .inventory import scan_archive
+from .utils import IMAGE_EXT, console, logger
+
+# Directories with fewer sampled pages than this borrow the library-wide ratio
+MIN_DIRECTORY_SAMPLES = 5
+
+
+def library_pages(comics, jobs=None):
+    """List every convertible page as ``(comic, type, name, size, packed)``."""
+    pages = []
+    with ThreadPoolExecutor(max_workers=jobs or 32) as pool:
+        futures = {pool.submit(scan_archive, c): c for c in comics}
+        for future in as_completed(futures):
+            comic = futures[future]
+            try:
+                filetype, members = future.result()
+            except (OSError, subprocess.CalledProcessError, zipfile.BadZipFile) as e:
+                logger.warning(f"Could not list {comic}: {e}")
+                continue
+            pages.extend(
+                (comic, filetype, name, size, packed)
+                for name, size, packed in members
+                if pathlib.PurePosixPath(name).suffix.lower() in IMAGE_EXT
+            )
+    return pages
+
+
+def read_page(comic, filetype, name):
+    if filetype == "zip":
+        with zipfile.ZipFile(comic) as archive:
+            return archive.read(name)
+    result = subprocess.run(
+        ["7z", "e", "-so", "--", str(comic), name], capture_output=True, check=True
+    )
+    return result.stdout
+
+
+def ratio_estimate(samples, total):
+    """Ratio estimate of sum(y) given sum(x) = ``total``, with a 95% margin.
+
+    ``samples`` are ``(x, y)`` pairs drawn at random from the population.
+    """
+    n = len(samples)
+    sum_x = sum(x for x, _ in samples)
+    ratio = sum(y for _, y in samples) / sum_x
+    if n < 2:
+        return ratio * total, 0.0
+    mean_x = sum_x / n
+    residual = sum((y - ratio * x) ** 2 for x, y in samples) / (n - 1)
+    margin = 1.96 * total / mean_x * math.sqrt(residual / n)
+    return ratio * total, margin
+
+
+class ConversionEstimate:
+    """Extrapolates a library conversion from a random sample of its pages.
+
+    Sampled pages are encoded with the real settings; output size and
+    encode time are then scaled up by source bytes, per directory and for
+    the whole library.
+    """
+
+    def __init__(self, pages, samples, jobs):
+        self.pages = pages
+        self.samples = samples
+        self.jobs = jobs
+
+    def rates(self, options):
+        packed = sum(s["packed"] for s in self.samples)
+        return {
+            "key": options.cache_key,
+            "seconds_per_byte": sum(s["seconds"] for s in self.samples) / packed,
+            "output_ratio": sum(s["out"] for s in self.samples)
+            / sum(s["size"] for s in self.samples),
+            "sampled_pages": len(self.samples),
+            "created": time.time(),
+        }
+
+    def extrapolate(self, pages, samples):
+        packed = sum(p[4] for p in pages)
+        size = sum(p[3] for p in pages)
+        output, margin = ratio_estimate([(s["size"], s["out"]) for s in samples], size)
+        cpu, _ = ratio_estimate([(s["packed"], s["seconds"]) for s in samples], packed)
+        return {
+            "archives": len({p[0] for p in pages}),
+            "pages": len(pages),
+            "source_bytes": packed,
+            "output_bytes": output,
+            "margin_bytes": margin,
+            "saved_bytes": packed - output,
+            "seconds": cpu / self.jobs,
+        }
+
+    def by_directory(self):
+        pages, samples = {}, {}
+        for page in self.pages:
+            pages.setdefault(page[0].parent, []).append(page)
+        for sample in self.samples:
+            samples.setdefault(sample["comic"].parent, []).append(sample)
+        rows = {}
+        for directory, dir_pages in sorted(pages.items()):
+            dir_samples = samples.get(directory, [])
+            if len(dir_samples) < MIN_DIRECTORY_SAMPLES:
+                dir_samples = self.samples
+            rows[directory] = self.extrapolate(dir_pages, dir_samples)
+        return rows
+
+    def total(self):
+        return self.extrapolate(self.pages, self.samples)
+
+
+def estimate_library(comics, options, sample=300, jobs=None, seed=None):
+    pages = library_pages(comics, jobs)
+    if not pages:
+        return None
+    picked = random.Random(seed).sample(pages, min(sample, len(pages)))
+
+    jobs = jobs or os.cpu_count() or 1
+    # Cap pages in flight so a big sample doesn't sit in memory all at once
+    slots = threading.BoundedSemaphore(jobs * 2)
+    samples = []
+    with Progress(console=console) as progress:
+        task = progress.add_task("[cyan]Sampling pages...", total=len(picked))
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {}
+            for comic, filetype, name, size, packed in picked:
+                slots.acquire()
+                try:
+                    data = read_page(comic, filetype, name)
+                except (OSError, subprocess.CalledProcessError, KeyError) as e:
+                    logger.warning(f"Could not read {name} from {comic}: {e}")
+                    slots.release()
+                    progress.advance(task)
+                    continue
+                future = pool.submit(encode_member, name, data, options)
+                future.add_done_callback(lambda _: slots.release())
+                futures[future] = (comic, size, packed)
+            for future in as_completed(futures):
+                comic, size, packed = futures[future]
+                try:
+                    _, _, payload, _, _, elapsed = future.result()
+                    samples.append(
+                        {
+                            "comic": comic,
+                            "size": size,
+                            "packed": packed,
+                            "out": len(payload),
+                            "seconds": elapsed,
+                        }
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to encode sample page: {e}")
+                progress.advance(task)
+    if not samples:
+        return None
+    return ConversionEstimate(pages, samples, jobs)
+
+
+def format_duration(seconds):
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours}h{rest // 60:02}m" if hours else f"{rest // 60}m{rest % 60:02}s"
+
+
+def print_estimate(estimate):
+    table = Table(title=f"Estimate from {len(estimate.samples)} sampled pages")
+    table.add_column("Directory")
+    table.add_column("Archives", justify="right")
+    table.add_column("Pages", justify="right")
+    table.add_column("Source MiB", justify="right")
+    table.add_column("Output MiB", justify="right")
+    table.add_column("Saved MiB", justify="right")
+    table.add_column("Time", justify="right")
+    rows = {**estimate.by_directory(), "[bold]Total[/bold]": estimate.total()}
+    for directory, row in rows.items():
+        table.add_row(
+            str(directory),
+            str(row["archives"]),
+            str(row["pages"]),
+            f"{row['source_bytes'] / 2**20:.1f}",
+            f"{row['output_bytes'] / 2**20:.1f} ± {row['margin_bytes'] / 2**20:.1f}",
+            f"{row['saved_bytes'] / 2**20:.1f}",
+            format_duration(row["seconds"]),
+        )
+    console.print(table)
+
+
+def save_rates(path, rates):
+    pathlib.Path(path).write_text(json.dumps(rates, indent=4))
+
+
+def load_rates(path, options):
+    """Rates from an earlier dry run, if it used the same encoder settings."""
+    try:
+        rates = json.loads(pathlib.Path(path).read_text())
+    except (OSError, json.JSONDecodeError):
+        return None
+    return rates if rates.get("key") == options.cache_key else None
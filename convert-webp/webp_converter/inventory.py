@@ -0,0 +1,201 @@
+import os
+import pathlib
+import sqlite3
+import subprocess
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from rich.progress import Progress
+from rich.table import Table
+
+from .detect import get_file_mime_type
+from .utils import ENCODED_EXT, IMAGE_EXT, console, logger
+from .zipread import central_directory
+
+
+def list_zip(path):
+    return [(ref.name, ref.size, ref.compressed) for ref in central_directory(path)]
+
+
+def list_with_7z(path):
+    """List a RAR/7z/tar archive from its headers via ``7z l -slt``."""
+    result = subprocess.run(
+        ["7z", "l", "-slt", "--", str(path)],
+        capture_output=True,
+        text=True,
+        errors="replace",
+        check=True,
+    )
+    # Everything after the dashed line is one "Key = value" block per member
+    _, _, listing = result.stdout.partition("\n----------\n")
+    members = []
+    for block in listing.split("\n\n"):
+        fields = dict(
+            line.split(" = ", 1) for line in block.splitlines() if " = " in line
+        )
+        if "Path" not in fields or fields.get("Folder") == "+":
+            continue
+        members.append(
+            (
+                fields["Path"],
+                int(fields.get("Size") or 0),
+                int(fields.get("Packed Size") or 0),
+            )
+        )
+    return members
+
+
+def scan_archive(path):
+    """Return ``(type, [(name, size, packed), ...])`` without extracting."""
+    filetype = get_file_mime_type(path)
+    if filetype == "zip":
+        return filetype, list_zip(path)
+    if filetype in ("rar", "7z", "tar"):
+        return filetype, list_with_7z(path)
+    return filetype, []
+
+
+class LibraryInventory:
+    """SQLite index of every archive and page in a library.
+
+    Archives are listed from their headers only (the zip central directory,
+    ``7z l`` for everything else), and a rescan skips any archive whose size
+    and mtime are unchanged, so refreshing a large library takes seconds.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS archives (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                type TEXT,
+                pages INTEGER,
+                image_pages INTEGER,
+                image_bytes INTEGER,
+                webp_pages INTEGER,
+                scanned REAL
+            )"""
+        )
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                archive TEXT,
+                name TEXT,
+                ext TEXT,
+                size INTEGER,
+                packed INTEGER,
+                PRIMARY KEY (archive, name)
+            )"""
+        )
+        self.db.commit()
+
+    def is_current(self, file):
+        try:
+            stat = file.stat()
+        except FileNotFoundError:
+            return False  # the scan reports it
+        row = self.db.execute(
+            "SELECT size, mtime_ns FROM archives WHERE path = ?",
+            (str(file.resolve()),),
+        ).fetchone()
+        return row == (stat.st_size, stat.st_mtime_ns)
+
+    def record(self, file, filetype, members):
+        path = str(file.resolve())
+        stat = file.stat()
+        pages = [
+            (path, name, pathlib.PurePosixPath(name).suffix.lower(), size, packed)
+            for name, size, packed in members
+            if pathlib.PurePosixPath(name).suffix.lower() in IMAGE_EXT | ENCODED_EXT
+        ]
+        images = [p for p in pages if p[2] in IMAGE_EXT]
+        self.db.execute("DELETE FROM pages WHERE archive = ?", (path,))
+        self.db.executemany(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)", pages
+        )
+        self.db.execute(
+            "INSERT OR REPLACE INTO archives VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                path,
+                stat.st_size,
+                stat.st_mtime_ns,
+                filetype,
+                len(pages),
+                len(images),
+                sum(p[3] for p in images),
+                len(pages) - len(images),
+                time.time(),
+            ),
+        )
+
+    def prune(self):
+        """Forget archives that no longer exist, e.g. a .cbr converted in place."""
+        gone = [
+            (path,)
+            for (path,) in self.db.execute("SELECT path FROM archives").fetchall()
+            if not os.path.exists(path)
+        ]
+        self.db.executemany("DELETE FROM pages WHERE archive = ?", gone)
+        self.db.executemany("DELETE FROM archives WHERE path = ?", gone)
+        return len(gone)
+
+    def update(self, comics, jobs=None):
+        """Scan every archive that changed since the last run, in parallel."""
+        self.prune()
+        comics = [c for c in comics if not self.is_current(c)]
+        with Progress(console=console) as progress:
+            task = progress.add_task("[cyan]Indexing...", total=len(comics))
+            with ThreadPoolExecutor(max_workers=jobs or 32) as pool:
+                futures = {pool.submit(scan_archive, c): c for c in comics}
+                for future in as_completed(futures):
+                    comic = futures[future]
+                    try:
+                        self.record(comic, *future.result())
+                    except (
+                        OSError,
+                        subprocess.CalledProcessError,
+                        zipfile.BadZipFile,
+                    ) as e:
+                        logger.warning(f"Could not index {comic}: {e}")
+                    progress.advance(task)
+        self.db.commit()
+        return len(comics)
+
+    def remaining(self):
+        """Archives that still hold JPEG/PNG/GIF pages, biggest first."""
+        return self.db.execute(
+            """SELECT path, image_pages, image_bytes FROM archives
+            WHERE image_pages > 0 ORDER BY image_bytes DESC"""
+        ).fetchall()
+
+    def summary(self):
+        return self.db.execute(
+            """SELECT COUNT(*), COALESCE(SUM(pages), 0),
+                SUM(image_pages > 0), COALESCE(SUM(image_pages), 0),
+                COALESCE(SUM(image_bytes), 0), SUM(webp_pages > 0 AND image_pages = 0)
+            FROM archives"""
+        ).fetchone()
+
+    def close(self):
+        self.db.close()
+
+
+def print_inventory_report(inventory, limit=20):
+    archives, pages, todo, todo_pages, todo_bytes, webp = inventory.summary()
+    console.print(
+        f"[bold]{archives} archives, {pages} pages: "
+        f"{webp or 0} already converted, {todo or 0} still to convert "
+        f"({todo_pages} pages, {todo_bytes / 2**30:.2f} GiB)[/bold]"
+    )
+    remaining = inventory.remaining()
+    if not remaining:
+        return
+    table = Table(title=f"Largest {min(limit, len(remaining))} left to convert")
+    table.add_column("Archive")
+    table.add_column("Pages", justify="right")
+    table.add_column("MiB", justify="right")
+    for path, image_pages, image_bytes in remaining[:limit]:
+        table.add_row(path, str(image_pages), f"{image_bytes / 2**20:.1f}")
+    console.print(table)
@@ -0,0 +1,114 @@
+import sqlite3
+import threading
+import time
+
+from rich.table import Table
+
+from .detect import is_webp_only
+from .utils import console, file_sha256
+
+
+class ConversionLedger:
+    """SQLite record of every archive the converter has already handled.
+
+    Rows are keyed by path. An unchanged size and mtime is a hit without
+    reading the file; a matching size with a new mtime falls back to
+    comparing content hashes, so touched-but-identical files still skip.
+    """
+
+    SKIP_STATUSES = ("converted", "already-webp", "kept-original")
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS archives (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                sha256 TEXT,
+                status TEXT,
+                updated REAL
+            )"""
+        )
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS page_quality (
+                sha256 TEXT,
+                target TEXT,
+                quality INTEGER,
+                PRIMARY KEY (sha256, target)
+            )"""
+        )
+        self.db.commit()
+
+    def lookup(self, file):
+        stat = file.stat()
+        with self.lock:
+            row = self.db.execute(
+                "SELECT size, mtime_ns, sha256, status FROM archives WHERE path = ?",
+                (str(file.resolve()),),
+            ).fetchone()
+        if not row or row[0] != stat.st_size:
+            return None
+        if row[1] == stat.st_mtime_ns:
+            return row[3]
+        if row[2] == file_sha256(file):
+            self.record(file, row[3], row[2])
+            return row[3]
+        return None
+
+    def record(self, file, status, sha256=None):
+        stat = file.stat()
+        sha256 = sha256 or file_sha256(file)
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO archives VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    str(file.resolve()),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    sha256,
+                    status,
+                    time.time(),
+                ),
+            )
+            self.db.commit()
+
+    def should_skip(self, file):
+        status = self.lookup(file)
+        if status in self.SKIP_STATUSES:
+            return status
+        if is_webp_only(file):
+            self.record(file, "already-webp")
+            return "already-webp"
+        return None
+
+    def cached_quality(self, sha256, target):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT quality FROM page_quality WHERE sha256 = ? AND target = ?",
+                (sha256, target),
+            ).fetchone()
+        return row[0] if row else None
+
+    def record_quality(self, sha256, target, quality):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO page_quality VALUES (?, ?, ?)",
+                (sha256, target, quality),
+            )
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+def print_skip_report(skipped):
+    if not skipped:
+        return
+    table = Table(title=f"Skipped {len(skipped)} archive(s)")
+    table.add_column("Archive")
+    table.add_column("Reason")
+    for file, reason in skipped:
+        table.add_row(str(file), reason)
+    console.print(table)
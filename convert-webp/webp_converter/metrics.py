@@ -0,0 +1,135 @@
+import contextlib
+import json
+import os
+import pathlib
+import threading
+import time
+
+
+class RunMetrics:
+    """Per-archive and per-stage measurements for a conversion run.
+
+    Every stage and archive result is appended to ``jsonl_path`` as one JSON
+    object per line. Running totals and queue depths are also rewritten to
+    ``prom_path`` in the Prometheus textfile-collector format.
+    """
+
+    def __init__(self, jsonl_path=None, prom_path=None):
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.archives = {}
+        self.queues = {}
+
+    def emit(self, event, **fields):
+        if not self.jsonl_path:
+            return
+        line = json.dumps({"ts": round(time.time(), 3), "event": event, **fields})
+        with self.lock, open(self.jsonl_path, "a") as f:
+            f.write(line + "\n")
+
+    @contextlib.contextmanager
+    def stage(self, archive, name, bytes_in=0):
+        """Time one stage; callers may fill in bytes_out and failures."""
+        record = {"bytes_in": bytes_in, "bytes_out": 0, "failures": 0}
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield record
+            ok = True
+        finally:
+            seconds = time.perf_counter() - start
+            if not ok:
+                record["failures"] += 1
+            with self.lock:
+                totals = self.stages.setdefault(
+                    name,
+                    dict.fromkeys(
+                        ("seconds", "runs", "failures", "bytes_in", "bytes_out"), 0
+                    ),
+                )
+                totals["seconds"] += seconds
+                totals["runs"] += 1
+                for key in ("failures", "bytes_in", "bytes_out"):
+                    totals[key] += record[key]
+            self.emit(
+                "stage",
+                archive=str(archive),
+                stage=name,
+                seconds=round(seconds, 4),
+                ok=ok,
+                **record,
+            )
+
+    def archive_done(self, archive, status, seconds, bytes_in=0, bytes_out=0):
+        with self.lock:
+            self.archives[status] = self.archives.get(status, 0) + 1
+        self.emit(
+            "archive",
+            archive=str(archive),
+            status=status,
+            seconds=round(seconds, 4),
+            bytes_in=bytes_in,
+            bytes_out=bytes_out,
+        )
+        self.write_prometheus()
+
+    def adjust_queue(self, name, delta):
+        with self.lock:
+            self.queues[name] = self.queues.get(name, 0) + delta
+            depths = dict(self.queues)
+        self.emit("queue", **depths)
+
+    def write_prometheus(self):
+        if not self.prom_path:
+            return
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                labels = f"{{{labels}}}" if labels else ""
+                lines.append(f"{name}{labels} {value}")
+
+        with self.lock:
+            stages = {k: dict(v) for k, v in self.stages.items()}
+            archives = dict(self.archives)
+            queues = dict(self.queues)
+        for key, help_text in (
+            ("seconds", "Time spent in each conversion stage."),
+            ("runs", "Number of times each stage ran."),
+            ("failures", "Failures seen in each stage."),
+            ("bytes_in", "Bytes read by each stage."),
+            ("bytes_out", "Bytes written by each stage."),
+        ):
+            metric(
+                f"webp_stage_{key}_total",
+                "counter",
+                help_text,
+                [(f'stage="{name}"', totals[key]) for name, totals in stages.items()],
+            )
+        metric(
+            "webp_archives_total",
+            "counter",
+            "Archives finished, by outcome.",
+            [(f'status="{status}"', count) for status, count in archives.items()],
+        )
+        metric(
+            "webp_queue_depth",
+            "gauge",
+            "Work waiting in each queue.",
+            [(f'queue="{name}"', depth) for name, depth in queues.items()],
+        )
+        metric(
+            "webp_last_update_timestamp_seconds",
+            "gauge",
+            "When this file was last written.",
+            [("", round(time.time(), 3))],
+        )
+
+        # node_exporter may read at any time, so swap the file in whole
+        tmp = pathlib.Path(f"{self.prom_path}.tmp")
+        tmp.write_text("\n".join(lines) + "\n")
+        os.replace(tmp, self.prom_path)
@@ -0,0 +1,373 @@
+import hashlib
+import os
+import pathlib
+import shutil
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from rich.progress import Progress
+
+from .archive import (
+    MANIFEST_NAME,
+    create_comic_archive,
+    finalize_archive,
+    is_output,
+    output_path,
+    page_manifest,
+    staging_path,
+)
+from .detect import encoded_suffix, get_file_mime_type
+from .encoders import EncodeOptions, encode_member, encode_page, resolve_encoder
+from .throttle import throttle
+from .thumbnails import thumbnails_from_source
+from .trace import span
+from .utils import COMIC_EXT, ENCODED_EXT, IMAGE_EXT, console, file_sha256, logger
+from .workdir import (
+    checkpoint_page,
+    create_work_dir,
+    encoded_page,
+    extract_comic,
+    list_images,
+    open_checkpoint,
+    pending_pages,
+)
+from .zipread import central_directory, encode_member_at, read_member
+
+
+def cached_quality(ledger, options, digest):
+    if not (ledger and options.adaptive):
+        return None
+    return ledger.cached_quality(digest, options.target_key)
+
+
+def log_encode_times(timings, name=""):
+    for encoder, times in timings.items():
+        console.print(
+            f"[dim]{name}{encoder}: {len(times)} pages, "
+            f"{sum(times) / len(times) * 1000:.1f} ms/page avg, "
+            f"{max(times) * 1000:.1f} ms max[/dim]"
+        )
+
+
+def encode_pages(
+    files,
+    work_path,
+    pool,
+    progress,
+    task,
+    options,
+    budget=None,
+    ledger=None,
+    cache=None,
+    thumbnails=None,
+):
+    # The cover is cut from the first page while a worker has it decoded
+    pages = sorted(list_images(work_path)) if thumbnails else []
+    cover = pages[0].name if pages else None
+    # The page hash is only needed for cache lookups and searched qualities
+    need_digest = cache or (ledger and options.adaptive)
+    timings = {}
+    futures = {}
+    with open_checkpoint(work_path) as checkpoint:
+        for file in files:
+            # Left over from an interrupted run, maybe in another codec
+            stale = encoded_page(work_path, file)
+            if stale:
+                stale.unlink()
+            out_path = work_path / f"{file.stem}.webp"
+            digest = file_sha256(file) if need_digest else None
+            if cache:
+                start = time.perf_counter()
+                hit = cache.get(cache.key(digest, options))
+                if hit:
+                    data = hit.read_bytes()
+                    out_path = out_path.with_suffix(encoded_suffix(data))
+                    out_path.write_bytes(data)
+                    checkpoint_page(checkpoint, file, out_path)
+                    timings.setdefault("cache", []).append(time.perf_counter() - start)
+                    progress.advance(task)
+                    continue
+            throttle(file.stat().st_size)
+            if budget:
+                with span("wait for slot", "wait"):
+                    budget.acquire()
+            try:
+                future = pool.submit(
+                    encode_page,
+                    file,
+                    out_path,
+                    options,
+                    cached_quality(ledger, options, digest),
+                    thumbnails if file.name == cover else None,
+                )
+            except BaseException:
+                if budget:
+                    budget.release()
+                raise
+            if budget:
+                future.add_done_callback(lambda _: budget.release())
+            futures[future] = digest
+
+        # Advance as pages finish so the bar tracks real progress
+        for future in as_completed(futures):
+            try:
+                file, used, quality, elapsed = future.result()
+                out_path = encoded_page(work_path, file)
+                checkpoint_page(checkpoint, file, out_path)
+                digest = futures[future]
+                if cache and used != "original":
+                    cache.put(cache.key(digest, options), out_path.read_bytes())
+                if ledger and options.adaptive:
+                    ledger.record_quality(digest, options.target_key, quality)
+                logger.debug(
+                    f"Encoded {file.name} with {used} at q{quality} in {elapsed:.3f}s"
+                )
+                timings.setdefault(used, []).append(elapsed)
+            except Exception as e:
+                logger.error(f"Failed to convert page: {e}")
+            progress.advance(task)
+    if cover and not thumbnails.done():
+        # Resumed, served from the cache or failed: decode the cover once here
+        thumbnails_from_source(work_path / cover, thumbnails)
+    return timings
+
+
+def convert_images_to_webp(
+    work_path, jobs=None, options=None, ledger=None, cache=None, thumbnails=None
+):
+    files = pending_pages(work_path)
+    options = options or EncodeOptions(resolve_encoder())
+
+    with Progress(console=console) as progress:
+        task = progress.add_task("[cyan]Converting images...", total=len(files))
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            timings = encode_pages(
+                files,
+                work_path,
+                pool,
+                progress,
+                task,
+                options,
+                ledger=ledger,
+                cache=cache,
+                thumbnails=thumbnails,
+            )
+    log_encode_times(timings)
+
+
+def stream_comic(
+    file,
+    output_zip,
+    pool,
+    progress,
+    slots,
+    options,
+    ledger=None,
+    cache=None,
+    thumbnails=None,
+):
+    """Convert a CBZ straight into a new CBZ without a work directory.
+
+    Each worker reads its pages straight from the mapped source zip,
+    encodes them in memory and they are written to ``output_zip`` as they
+    finish. ``slots`` caps how many pages
+    are in flight, which also caps memory use. With ``thumbnails`` the
+    worker that encodes the cover also writes its thumbnails.
+    """
+    output_zip = pathlib.Path(output_zip)
+    tmp_zip = output_zip.with_name(f".{output_zip.name}.tmp")
+    timings = {}
+    digests = {}
+    sources = {}
+    packed = []
+
+    def write(future, target):
+        member = sources.pop(future)
+        try:
+            name, out_name, webp, used, quality, elapsed = future.result()
+        except Exception as e:
+            # Keep the page as it was rather than dropping it from the archive;
+            # if even that can't be read, the whole archive fails
+            logger.error(f"Failed to convert {member.name}, keeping it as-is: {e}")
+            name = pathlib.PurePosixPath(member.name).name
+            original = read_member(file, member)
+            target.writestr(name, original, compress_type=zipfile.ZIP_STORED)
+            packed.append((name, name, len(original)))
+        else:
+            target.writestr(out_name, webp, compress_type=zipfile.ZIP_STORED)
+            packed.append((pathlib.PurePosixPath(name).name, out_name, len(webp)))
+            digest = digests.get(future)
+            if cache and used != "original":
+                cache.put(cache.key(digest, options), webp)
+            if ledger and options.adaptive:
+                ledger.record_quality(digest, options.target_key, quality)
+            logger.debug(f"Encoded {name} with {used} at q{quality} in {elapsed:.3f}s")
+            timings.setdefault(used, []).append(elapsed)
+        digests.pop(future, None)
+        progress.advance(task)
+
+    try:
+        with zipfile.ZipFile(tmp_zip, "w", zipfile.ZIP_DEFLATED) as target:
+            # One pass over the central directory; workers then read their
+            # pages by offset, so encoding starts before the archive is read
+            members = central_directory(file)
+            pages = [
+                m
+                for m in members
+                if pathlib.PurePosixPath(m.name).suffix.lower() in IMAGE_EXT
+            ]
+            task = progress.add_task(f"[cyan]{file.name}", total=len(pages))
+            cover = (
+                min(pages, key=lambda m: pathlib.PurePosixPath(m.name).name)
+                if thumbnails and pages
+                else None
+            )
+
+            for member in members:
+                name = pathlib.PurePosixPath(member.name)
+                if name.suffix.lower() == ".xml":
+                    target.writestr(name.name, read_member(file, member))
+                elif name.suffix.lower() in ENCODED_EXT:
+                    # Already converted pages go over as they are
+                    data = read_member(file, member)
+                    target.writestr(name.name, data, compress_type=zipfile.ZIP_STORED)
+                    packed.append((name.name, name.name, len(data)))
+
+            need_digest = cache or (ledger and options.adaptive)
+            pending = set()
+            for member in pages:
+                wanted = thumbnails if member is cover else None
+                throttle(member.compressed)
+                if need_digest:
+                    # Cache lookups and stored qualities need the page hash,
+                    # so these pages are still read here and shipped over
+                    data = read_member(file, member)
+                    digest = hashlib.sha256(data).hexdigest()
+                    if cache:
+                        start = time.perf_counter()
+                        hit = cache.get(cache.key(digest, options))
+                        if hit:
+                            webp = hit.read_bytes()
+                            name = pathlib.PurePosixPath(member.name)
+                            out_name = f"{name.stem}{encoded_suffix(webp)}"
+                            target.writestr(
+                                out_name, webp, compress_type=zipfile.ZIP_STORED
+                            )
+                            packed.append((name.name, out_name, len(webp)))
+                            elapsed = time.perf_counter() - start
+                            timings.setdefault("cache", []).append(elapsed)
+                            progress.advance(task)
+                            continue
+                    call = (
+                        encode_member,
+                        member.name,
+                        data,
+                        options,
+                        cached_quality(ledger, options, digest),
+                        wanted,
+                    )
+                else:
+                    digest = None
+                    call = (encode_member_at, file, member, options, None, wanted)
+                # Only a submitted page holds a slot; in a batch ``slots`` is
+                # shared, so one leaked by a failed submit is gone for good
+                with span("wait for slot", "wait"):
+                    slots.acquire()
+                try:
+                    future = pool.submit(*call)
+                except BaseException:
+                    slots.release()
+                    raise
+                future.add_done_callback(lambda _: slots.release())
+                digests[future] = digest
+                sources[future] = member
+                pending.add(future)
+                # Flush finished pages so encoded data doesn't pile up in memory
+                for done in [f for f in pending if f.done()]:
+                    pending.discard(done)
+                    write(done, target)
+            for future in as_completed(pending):
+                write(future, target)
+            if cover and not thumbnails.done():
+                thumbnails_from_source(read_member(file, cover), thumbnails)
+            if options.codecs:
+                target.writestr(MANIFEST_NAME, page_manifest(packed))
+    except BaseException:
+        tmp_zip.unlink(missing_ok=True)
+        raise
+
+    # Only swap the finished archive into place, never a partial one
+    os.replace(tmp_zip, output_zip)
+    progress.remove_task(task)
+    return timings
+
+
+def process_comic(
+    file,
+    jobs=None,
+    options=None,
+    stream=False,
+    ledger=None,
+    cache=None,
+    in_place=False,
+    work_root=None,
+    thumbnails=None,
+):
+    file = pathlib.Path(file)
+    if not file.exists():
+        console.print(f"[red]File not found: {file}[/red]")
+        return
+
+    options = options or EncodeOptions(resolve_encoder())
+    output_zip = output_path(file, in_place)
+    staged = staging_path(output_zip)
+    request = thumbnails.request(file) if thumbnails else None
+    if stream and get_file_mime_type(file) == "zip":
+        jobs = jobs or os.cpu_count() or 1
+        with Progress(console=console) as progress:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                slots = threading.BoundedSemaphore(jobs * 2)
+                timings = stream_comic(
+                    file,
+                    staged,
+                    pool,
+                    progress,
+                    slots,
+                    options,
+                    ledger,
+                    cache,
+                    request,
+                )
+        log_encode_times(timings)
+    else:
+        work_path = create_work_dir(file, work_root)
+        extract_comic(work_path, file, jobs)
+        convert_images_to_webp(work_path, jobs, options, ledger, cache, request)
+        create_comic_archive(work_path, staged, jobs, bool(options.codecs))
+        shutil.rmtree(work_path)
+    converted = finalize_archive(file, output_zip, options.keep_smaller, in_place)
+    if thumbnails:
+        thumbnails.publish(file, output_zip if converted else file)
+    if not converted:
+        return
+    console.print(f"[bold green]Conversion complete: {file}[/bold green]")
+
+
+def find_comics(paths, in_place=False):
+    comics = []
+    for item in paths:
+        path = pathlib.Path(item)
+        if path.is_dir():
+            # Earlier conversions sit next to their sources; leave them be
+            comics.extend(
+                sorted(
+                    p
+                    for p in path.rglob("*")
+                    if p.suffix.lower() in COMIC_EXT and not is_output(p, in_place)
+                )
+            )
+        else:
+            comics.append(path)
+    return comics
@@ -0,0 +1,357 @@
+import os
+import queue
+import shutil
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from rich.progress import Progress
+
+from .archive import create_comic_archive, finalize_archive, output_path, staging_path
+from .detect import get_file_mime_type
+from .encoders import EncodeOptions, resolve_encoder
+from .estimate import format_duration
+from .ledger import print_skip_report
+from .metrics import RunMetrics
+from .pipeline import encode_pages, log_encode_times, stream_comic
+from .trace import span
+from .utils import console, logger, output_size
+from .workdir import (
+    create_work_dir,
+    encoded_page,
+    encoded_pages,
+    extract_comic,
+    list_images,
+    pending_pages,
+)
+from .zipread import count_pages
+
+# Page size assumed for RAR/7z archives when no zip gives a better estimate
+DEFAULT_PAGE_BYTES = 512 * 1024
+
+
+@dataclass
+class ArchiveJob:
+    """One archive on its way through the extract, encode and pack stages."""
+
+    file: object
+    start: float
+    bytes_in: int
+    work_path: object = None
+    error: Exception = None
+
+
+class LibraryScheduler:
+    """Converts many archives at once under a single worker budget.
+
+    Every extraction, page encode and re-zip holds one slot of the budget,
+    so archive-level and page-level work never exceed ``jobs`` between them.
+    """
+
+    def __init__(
+        self,
+        jobs=None,
+        archives=None,
+        options=None,
+        stream=False,
+        ledger=None,
+        force=False,
+        metrics=None,
+        cache=None,
+        in_place=False,
+        work_root=None,
+        rates=None,
+        thumbnails=None,
+    ):
+        self.jobs = jobs or os.cpu_count() or 1
+        self.options = options or EncodeOptions(resolve_encoder())
+        self.stream = stream
+        self.ledger = ledger
+        self.force = force
+        self.metrics = metrics or RunMetrics()
+        self.cache = cache
+        self.in_place = in_place
+        self.work_root = work_root
+        self.rates = rates
+        self.thumbnails = thumbnails
+        self.archives = archives or max(1, min(4, self.jobs // 2))
+        self.budget = threading.BoundedSemaphore(self.jobs)
+
+    def filter_done(self, comics):
+        todo, skipped = [], []
+        for comic in comics:
+            status = None
+            if self.ledger and not self.force and comic.exists():
+                try:
+                    status = self.ledger.should_skip(comic)
+                except (OSError, zipfile.BadZipFile) as e:
+                    logger.warning(f"Could not check ledger for {comic}: {e}")
+            if status:
+                skipped.append((comic, status))
+            else:
+                todo.append(comic)
+        return todo, skipped
+
+    def largest_first(self, comics):
+        """Order archives by descending page count (LPT scheduling).
+
+        Zip page counts come from the central directory; other archives are
+        estimated from their size and the average page size of the zips.
+        """
+
+        def scan(comic):
+            size = output_size(comic)
+            try:
+                if get_file_mime_type(comic) == "zip":
+                    return size, count_pages(comic)
+            except (OSError, zipfile.BadZipFile) as e:
+                logger.warning(f"Could not read {comic}: {e}")
+            return size, None
+
+        with ThreadPoolExecutor(max_workers=32) as scan_pool:
+            scanned = dict(zip(comics, scan_pool.map(scan, comics)))
+        counted = [(s, n) for s, n in scanned.values() if n]
+        page_bytes = (
+            sum(s for s, _ in counted) / sum(n for _, n in counted)
+            if counted
+            else DEFAULT_PAGE_BYTES
+        )
+
+        def weight(comic):
+            size, pages = scanned[comic]
+            return pages if pages is not None else size / page_bytes
+
+        return sorted(comics, key=weight, reverse=True)
+
+    def run(self, comics):
+        comics, skipped = self.filter_done(comics)
+        comics = self.largest_first(comics)
+        with Progress(console=console) as progress:
+            overall = progress.add_task("[magenta]Archives...", total=len(comics))
+            self.remaining = sum(output_size(c) for c in comics)
+            self.update_eta(progress, overall)
+            self.metrics.adjust_queue("archives", len(comics))
+            with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+                if self.stream:
+                    self.run_concurrent(comics, pool, progress, overall)
+                else:
+                    self.run_pipelined(comics, pool, progress, overall)
+        for comic, status in skipped:
+            self.metrics.archive_done(comic, status, 0)
+        self.metrics.write_prometheus()
+        print_skip_report(skipped)
+
+    def run_concurrent(self, comics, pool, progress, overall):
+        with ThreadPoolExecutor(max_workers=self.archives) as archive_pool:
+            futures = {
+                archive_pool.submit(self.process, comic, pool, progress): comic
+                for comic in comics
+            }
+            for future in as_completed(futures):
+                self.record_result(futures[future], future)
+                self.advance(progress, overall, futures[future])
+
+    def run_pipelined(self, comics, pool, progress, overall):
+        """Overlap extract, encode and pack across consecutive archives.
+
+        One thread extracts, ``archives`` threads feed pages to the pool and
+        this thread packs, so the next archive is extracted while the current
+        one encodes and the previous one is zipped. The queues between the
+        stages are bounded, which caps how many work directories exist at once.
+        """
+        extracted = queue.Queue(maxsize=1)
+        encoded = queue.Queue(maxsize=1)
+
+        def extract_stage():
+            for comic in comics:
+                job = ArchiveJob(comic, *self.started(comic))
+                try:
+                    job.work_path = self.extract(comic)
+                except Exception as e:
+                    job.error = e
+                with span("wait for encoder", "wait"):
+                    extracted.put(job)
+            for _ in range(self.archives):
+                extracted.put(None)
+
+        def encode_stage():
+            while (job := extracted.get()) is not None:
+                if not job.error:
+                    try:
+                        self.encode(job.file, job.work_path, pool, progress)
+                    except Exception as e:
+                        job.error = e
+                encoded.put(job)
+
+        threads = [threading.Thread(target=extract_stage, daemon=True)]
+        threads += [
+            threading.Thread(target=encode_stage, daemon=True)
+            for _ in range(self.archives)
+        ]
+        for thread in threads:
+            thread.start()
+        for _ in comics:
+            with span("wait for encoded archive", "wait"):
+                job = encoded.get()
+            status = "failed"
+            try:
+                if job.error:
+                    raise job.error
+                status = self.pack(job.file, job.work_path)
+            except Exception as e:
+                logger.error(f"Failed to convert {job.file}: {e}")
+            finally:
+                self.ended(job.file, status, job.start, job.bytes_in)
+            self.record_status(job.file, status)
+            self.advance(progress, overall, job.file, job.bytes_in)
+        for thread in threads:
+            thread.join()
+
+    def update_eta(self, progress, overall):
+        # Rich's own ETA needs a few finished archives; a dry run's measured
+        # rate gives one from the start
+        if not self.rates:
+            return
+        seconds = self.remaining * self.rates["seconds_per_byte"] / self.jobs
+        progress.update(
+            overall,
+            description=f"[magenta]Archives (~{format_duration(seconds)} left)...",
+        )
+
+    def advance(self, progress, overall, comic, bytes_in=None):
+        if bytes_in is None:
+            bytes_in = output_size(comic)
+        self.remaining = max(0, self.remaining - bytes_in)
+        progress.advance(overall)
+        self.update_eta(progress, overall)
+
+    def record_result(self, comic, future):
+        try:
+            status = future.result()
+        except Exception as e:
+            logger.error(f"Failed to convert {comic}: {e}")
+            status = "failed"
+        return self.record_status(comic, status)
+
+    def record_status(self, comic, status):
+        if self.ledger and comic.exists():
+            self.ledger.record(comic, status)
+        return status
+
+    def started(self, file):
+        self.metrics.adjust_queue("archives", -1)
+        self.metrics.adjust_queue("active", 1)
+        return time.perf_counter(), output_size(file)
+
+    def ended(self, file, status, start, bytes_in):
+        self.metrics.adjust_queue("active", -1)
+        self.metrics.archive_done(
+            file,
+            status,
+            time.perf_counter() - start,
+            bytes_in,
+            output_size(output_path(file, self.in_place)),
+        )
+
+    def process(self, file, pool, progress):
+        start, bytes_in = self.started(file)
+        status = "failed"
+        try:
+            status = self.convert(file, pool, progress)
+        finally:
+            self.ended(file, status, start, bytes_in)
+        return status
+
+    def convert(self, file, pool, progress):
+        if self.stream and file.exists() and get_file_mime_type(file) == "zip":
+            staged = staging_path(output_path(file, self.in_place))
+            stage = self.metrics.stage(file, "stream", output_size(file))
+            with stage as record, span("stream", "archive", archive=file.name):
+                timings = stream_comic(
+                    file,
+                    staged,
+                    pool,
+                    progress,
+                    self.budget,
+                    self.options,
+                    self.ledger,
+                    self.cache,
+                    self.thumbnail_request(file),
+                )
+                record["bytes_out"] = output_size(staged)
+            log_encode_times(timings, f"{file.name} - ")
+            return self.finish(file)
+
+        work_path = self.extract(file)
+        self.encode(file, work_path, pool, progress)
+        return self.pack(file, work_path)
+
+    def extract(self, file):
+        if not file.exists():
+            console.print(f"[red]File not found: {file}[/red]")
+            raise FileNotFoundError(file)
+
+        work_path = create_work_dir(file, self.work_root)
+        with self.budget, self.metrics.stage(
+            file, "extract", output_size(file)
+        ) as record:
+            # One slot, one thread: pages are what the budget is for
+            extract_comic(work_path, file, 1)
+            record["bytes_out"] = sum(f.stat().st_size for f in list_images(work_path))
+        return work_path
+
+    def encode(self, file, work_path, pool, progress):
+        files = pending_pages(work_path)
+        task = progress.add_task(f"[cyan]{file.name}", total=len(files))
+        self.metrics.adjust_queue("pages", len(files))
+        pages_in = sum(f.stat().st_size for f in files)
+        try:
+            with self.metrics.stage(file, "encode", pages_in) as record:
+                timings = encode_pages(
+                    files,
+                    work_path,
+                    pool,
+                    progress,
+                    task,
+                    self.options,
+                    self.budget,
+                    self.ledger,
+                    self.cache,
+                    self.thumbnail_request(file),
+                )
+                record["bytes_out"] = sum(
+                    out.stat().st_size
+                    for f in files
+                    if (out := encoded_page(work_path, f))
+                )
+                record["failures"] = len(files) - sum(map(len, timings.values()))
+        finally:
+            self.metrics.adjust_queue("pages", -len(files))
+        progress.remove_task(task)
+        log_encode_times(timings, f"{file.name} - ")
+
+    def pack(self, file, work_path):
+        staged = staging_path(output_path(file, self.in_place))
+        encoded_bytes = sum(f.stat().st_size for f in encoded_pages(work_path))
+        with self.budget, self.metrics.stage(file, "pack", encoded_bytes) as record:
+            create_comic_archive(work_path, staged, 1, bool(self.options.codecs))
+            record["bytes_out"] = output_size(staged)
+        shutil.rmtree(work_path)
+        return self.finish(file)
+
+    def thumbnail_request(self, file):
+        return self.thumbnails.request(file) if self.thumbnails else None
+
+    def finish(self, file):
+        output = output_path(file, self.in_place)
+        converted = finalize_archive(
+            file, output, self.options.keep_smaller, self.in_place
+        )
+        if self.thumbnails:
+            self.thumbnails.publish(file, output if converted else file)
+        if not converted:
+            return "kept-original"
+        console.print(f"[bold green]Conversion complete: {file}[/bold green]")
+        return "converted"
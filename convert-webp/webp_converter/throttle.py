@@ -0,0 +1,191 @@
+import ctypes
+import ctypes.util
+import os
+import platform
+import signal
+import subprocess
+import threading
+import time
+
+from .utils import logger
+
+# ioprio_set isn't wrapped by libc, so it goes through syscall(2)
+IOPRIO_SET_SYSCALL = {"x86_64": 251, "i686": 289, "aarch64": 30, "armv7l": 314}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+
+_limiter = None
+
+
+def lower_priority(niceness=10):
+    """Drop this process to background CPU and idle I/O priority.
+
+    Call it before any pools start: threads, pool workers and the encoder
+    processes they spawn all inherit both priorities.
+    """
+    if hasattr(os, "nice"):
+        os.nice(niceness)
+    else:
+        logger.warning("CPU priority can't be lowered on this platform")
+
+    syscall = IOPRIO_SET_SYSCALL.get(platform.machine())
+    libc_name = ctypes.util.find_library("c")
+    if platform.system() != "Linux" or not syscall or not libc_name:
+        logger.warning("I/O priority can't be lowered on this platform")
+        return
+    libc = ctypes.CDLL(libc_name, use_errno=True)
+    ioprio = IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT
+    if libc.syscall(syscall, IOPRIO_WHO_PROCESS, 0, ioprio) < 0:
+        logger.warning(f"ioprio_set failed: {os.strerror(ctypes.get_errno())}")
+
+
+class BandwidthLimiter:
+    """Token bucket shared by every reader and writer in this process."""
+
+    def __init__(self, bytes_per_sec):
+        self.rate = bytes_per_sec
+        self.tokens = bytes_per_sec
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, nbytes):
+        with self.lock:
+            now = time.monotonic()
+            # Allow at most one second of burst after an idle spell
+            self.tokens = min(self.rate, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= nbytes
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+def limit_bandwidth(bytes_per_sec):
+    global _limiter
+    _limiter = BandwidthLimiter(bytes_per_sec) if bytes_per_sec else None
+
+
+def throttle(nbytes):
+    """Account for ``nbytes`` of archive I/O, sleeping if over the cap."""
+    if _limiter:
+        _limiter.consume(nbytes)
+
+
+def process_io(pid):
+    """Bytes a process has read and written so far, from /proc/<pid>/io."""
+    with open(f"/proc/{pid}/io") as f:
+        info = dict(line.split(":", 1) for line in f)
+    return int(info["rchar"]) + int(info["wchar"])
+
+
+def run_throttled(command, interval=0.05):
+    """Run an external tool whose own reads and writes count against the cap.
+
+    Its I/O counters are polled and charged as it goes; while the limiter
+    makes it wait, the tool is stopped, so it can't burst ahead at full disk
+    speed. Without a cap, or without /proc, it simply runs.
+    """
+    if not _limiter or not os.path.exists("/proc/self/io"):
+        subprocess.run(
+            command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
+        )
+        return
+    proc = subprocess.Popen(
+        command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    charged = 0
+    try:
+        while True:
+            # WNOWAIT leaves an exited tool unreaped, so its last counts can
+            # still be read and charged
+            exited = os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT)
+            moved = process_io(proc.pid)
+            if moved > charged:
+                # os.kill, not send_signal, which would reap the exited tool
+                os.kill(proc.pid, signal.SIGSTOP)
+                try:
+                    _limiter.consume(moved - charged)
+                finally:
+                    os.kill(proc.pid, signal.SIGCONT)
+                charged = moved
+            if exited:
+                break
+            time.sleep(interval)
+    except BaseException:
+        proc.kill()
+        raise
+    finally:
+        proc.wait()
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, command)
+
+
+def memory_available():
+    """Fraction of RAM available, or None where /proc/meminfo doesn't exist."""
+    try:
+        with open("/proc/meminfo") as f:
+            info = dict(line.split(":", 1) for line in f)
+    except OSError:
+        return None
+    total = int(info["MemTotal"].split()[0])
+    return int(info["MemAvailable"].split()[0]) / total
+
+
+class LoadGovernor:
+    """Shrinks and regrows a worker budget to follow host load.
+
+    Slots are taken out of the scheduler's semaphore while the load other
+    processes put on the host is above the CPU count or memory is short,
+    one per check, and handed back one at a time once the host is idle
+    again. At least one slot always stays in play, so a run never stalls
+    completely.
+    """
+
+    def __init__(self, budget, jobs, interval=5.0, min_free=0.1):
+        self.budget = budget
+        self.jobs = jobs
+        self.interval = interval
+        self.min_free = min_free
+        self.held = 0
+        self.cpus = os.cpu_count() or 1
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        if not hasattr(os, "getloadavg"):
+            logger.warning("No load average on this platform, not adapting workers")
+            return
+        self.thread.start()
+
+    def pressure(self):
+        # Our own workers count toward the load average too; without taking
+        # them out, a run sized to the CPU count would throttle itself
+        load = max(0.0, os.getloadavg()[0] - (self.jobs - self.held))
+        free = memory_available()
+        if load > self.cpus or (free is not None and free < self.min_free):
+            return "high"
+        if load < self.cpus / 2 and (free is None or free > self.min_free * 2):
+            return "idle"
+        return None
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            pressure = self.pressure()
+            if pressure == "high" and self.held < self.jobs - 1:
+                # Waits for a running task to finish rather than preempting it
+                if self.budget.acquire(timeout=self.interval):
+                    self.held += 1
+                    logger.info(f"Host busy, down to {self.jobs - self.held} workers")
+            elif pressure == "idle" and self.held:
+                self.budget.release()
+                self.held -= 1
+                logger.info(f"Host idle, back up to {self.jobs - self.held} workers")
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        for _ in range(self.held):
+            self.budget.release()
+        self.held = 0
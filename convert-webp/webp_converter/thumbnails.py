@@ -0,0 +1,105 @@
+import hashlib
+import io
+import os
+import pathlib
+import shutil
+from dataclasses import dataclass
+
+from .utils import file_sha256, logger
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+DEFAULT_SIZES = ((300, 450),)
+
+
+@dataclass(frozen=True)
+class ThumbnailRequest:
+    """Cover thumbnails to cut from a page while it is decoded anyway."""
+
+    directory: str
+    sizes: tuple
+
+    def path(self, size):
+        return pathlib.Path(self.directory) / f"{size[0]}x{size[1]}.webp"
+
+    def done(self):
+        return all(self.path(size).exists() for size in self.sizes)
+
+
+@dataclass(frozen=True)
+class ThumbnailOptions:
+    """Sidecar cover cache: ``root/<sha[:2]>/<sha>/<w>x<h>.webp``.
+
+    ``sha`` is the SHA-256 of the archive that ends up in the library, so a
+    reader can find the covers of any CBZ without opening it.
+    """
+
+    root: str
+    sizes: tuple = DEFAULT_SIZES
+
+    def pending(self, file):
+        # Until the archive is final its hash is unknown, so park them by path
+        path_hash = hashlib.md5(str(pathlib.Path(file).resolve()).encode())
+        return pathlib.Path(self.root) / ".pending" / path_hash.hexdigest()
+
+    def request(self, file):
+        return ThumbnailRequest(str(self.pending(file)), self.sizes)
+
+    def directory(self, archive_sha256):
+        return pathlib.Path(self.root) / archive_sha256[:2] / archive_sha256
+
+    def publish(self, file, archive):
+        """Move the covers cut for ``file`` under the hash of ``archive``.
+
+        ``archive`` is the converted CBZ, or the source itself when the
+        conversion was rolled back.
+        """
+        pending = self.pending(file)
+        if not pending.exists():
+            return None
+        target = self.directory(file_sha256(archive))
+        if target.exists():
+            shutil.rmtree(target)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(pending, target)
+        return target
+
+
+def parse_sizes(text):
+    """Turn ``"150x225,300x450"`` into ``((150, 225), (300, 450))``."""
+    sizes = []
+    for item in text.split(","):
+        width, _, height = item.strip().lower().partition("x")
+        sizes.append((int(width), int(height)))
+    return tuple(sizes)
+
+
+def write_thumbnails(image, request):
+    """Cut every requested size from an already decoded ``image``."""
+    try:
+        pathlib.Path(request.directory).mkdir(parents=True, exist_ok=True)
+        for size in request.sizes:
+            thumb = image.copy()
+            if thumb.mode not in ("RGB", "RGBA", "L"):
+                thumb = thumb.convert("RGBA" if "transparency" in thumb.info else "RGB")
+            thumb.thumbnail(size, Image.LANCZOS)
+            thumb.save(request.path(size), "WEBP", quality=80)
+    except Exception as e:
+        # A missing cover shouldn't cost the page its conversion
+        logger.warning(f"Could not write cover thumbnails: {e}")
+
+
+def thumbnails_from_source(source, request):
+    """Decode ``source`` just for its covers, when no decoded page is at hand."""
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    try:
+        with Image.open(source) as image:
+            image.load()
+    except Exception as e:
+        logger.warning(f"Could not decode cover for thumbnails: {e}")
+        return
+    write_thumbnails(image, request)
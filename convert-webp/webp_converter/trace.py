@@ -0,0 +1,124 @@
+import contextlib
+import json
+import os
+import pathlib
+import shutil
+import threading
+import time
+
+# Set by enable_trace() and inherited by pool workers, so every process
+# knows to record and where to put its share of the events
+TRACE_ENV = "C2W_TRACE"
+
+_lock = threading.Lock()
+_sink = None
+_sink_pid = None
+_named = set()
+
+
+def _reset_after_fork():
+    # Workers fork while other threads may be inside emit(); like logging,
+    # start the child with a fresh lock rather than one held forever
+    global _lock, _sink, _sink_pid
+    _lock = threading.Lock()
+    _sink = _sink_pid = None
+    _named.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def enable_trace(path):
+    parts = pathlib.Path(f"{path}.parts")
+    # Whatever a crashed run left behind would end up in this trace
+    shutil.rmtree(parts, ignore_errors=True)
+    parts.mkdir(parents=True)
+    os.environ[TRACE_ENV] = str(parts)
+
+
+def now_us():
+    # The monotonic clock is shared by all processes, so lanes line up
+    return time.monotonic_ns() // 1000
+
+
+def emit(event):
+    global _sink, _sink_pid
+    pid = os.getpid()
+    tid = threading.get_native_id()
+    with _lock:
+        if _sink_pid != pid:
+            # Each process appends to its own file; forked workers reopen
+            parts = pathlib.Path(os.environ[TRACE_ENV])
+            _sink = open(parts / f"{pid}.jsonl", "a", buffering=1)
+            _sink_pid = pid
+            _named.clear()
+        if tid not in _named:
+            _named.add(tid)
+            name = threading.current_thread().name
+            _sink.write(
+                json.dumps(
+                    {
+                        "ph": "M",
+                        "name": "thread_name",
+                        "pid": pid,
+                        "tid": tid,
+                        "args": {"name": f"{name} ({tid})"},
+                    }
+                )
+                + "\n"
+            )
+        _sink.write(json.dumps({**event, "pid": pid, "tid": tid}) + "\n")
+
+
+@contextlib.contextmanager
+def span(name, category, **args):
+    """Record the enclosed block as one Chrome trace "complete" event."""
+    if not os.environ.get(TRACE_ENV):
+        yield
+        return
+    start = now_us()
+    try:
+        yield
+    finally:
+        emit(
+            {
+                "ph": "X",
+                "name": name,
+                "cat": category,
+                "ts": start,
+                "dur": now_us() - start,
+                "args": args,
+            }
+        )
+
+
+def write_trace(path):
+    """Merge every process's events into one trace-event JSON file.
+
+    The result loads in Perfetto or chrome://tracing, with one lane per
+    scheduler thread and per encoder worker.
+    """
+    global _sink, _sink_pid
+    parts = pathlib.Path(f"{path}.parts")
+    events = []
+    for part in sorted(parts.glob("*.jsonl")):
+        pid = int(part.stem)
+        label = "scheduler" if pid == os.getpid() else "encoder worker"
+        events.append(
+            {"ph": "M", "name": "process_name", "pid": pid, "args": {"name": label}}
+        )
+        for line in part.read_text().splitlines():
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue  # a worker killed mid-write
+    pathlib.Path(path).write_text(
+        json.dumps({"traceEvents": events, "displayTimeUnit": "ms"})
+    )
+    shutil.rmtree(parts, ignore_errors=True)
+    with _lock:
+        if _sink:
+            _sink.close()
+        _sink = _sink_pid = None
+    os.environ.pop(TRACE_ENV, None)
@@ -0,0 +1,27 @@
+import hashlib
+import logging
+
+from rich.console import Console
+
+console = Console()
+logger = logging.getLogger("webp_converter")
+
+COMIC_EXT = {".cbz", ".cbr"}
+IMAGE_EXT = {".jpg", ".jpeg", ".png", ".gif"}
+# What converted pages can be, depending on which codec won
+ENCODED_EXT = {".webp", ".avif", ".jxl"}
+
+# Already-compressed formats that gain nothing from Deflate
+STORED_EXT = {".webp", ".jpg", ".jpeg", ".png", ".gif", ".jxl", ".avif"}
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def output_size(path):
+    return path.stat().st_size if path.exists() else 0
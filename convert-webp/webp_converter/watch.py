@@ -0,0 +1,214 @@
+import ctypes
+import ctypes.util
+import json
+import os
+import pathlib
+import select
+import struct
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from rich.progress import Progress
+
+from .archive import is_output
+from .detect import is_webp_only
+from .pipeline import find_comics
+from .utils import COMIC_EXT, console, output_size
+
+
+class Inotify:
+    """Minimal ctypes binding to Linux inotify."""
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True) if libc_name else None
+        if not self.libc or not hasattr(self.libc, "inotify_init1"):
+            raise OSError("inotify is only available on Linux")
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+
+    def watch(self, directory):
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Cannot watch {directory}")
+        self.dirs[wd] = pathlib.Path(directory)
+
+    def read(self, timeout):
+        """Yield ``(path, mask)`` for events within ``timeout`` seconds."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                yield None, mask
+            elif wd in self.dirs:
+                yield self.dirs[wd] / os.fsdecode(name), mask
+
+    def close(self):
+        os.close(self.fd)
+
+
+class WatchFolder:
+    """Convert archives dropped into an inbox as soon as they finish writing.
+
+    A file is only queued once inotify has been quiet about it for
+    ``settle`` seconds and its size stopped changing, so half-copied
+    downloads are left alone. Queued archives go through the scheduler's
+    normal per-archive path with at most ``scheduler.archives`` at a time.
+    """
+
+    def __init__(self, inbox, scheduler, settle=10.0, status_path=None):
+        self.inbox = pathlib.Path(inbox)
+        self.scheduler = scheduler
+        self.settle = settle
+        self.status_path = status_path
+        self.inotify = Inotify()
+        self.lock = threading.Lock()
+        self.pending = {}  # path -> (last event, last size)
+        self.queued = set()
+        self.active = set()
+        self.done = {"converted": 0, "kept-original": 0, "failed": 0, "skipped": 0}
+        self.bytes_done = 0
+        self.started = time.time()
+
+    def watch_tree(self, root):
+        for directory in [root, *(p for p in root.rglob("*") if p.is_dir())]:
+            self.inotify.watch(directory)
+
+    def note(self, path):
+        if (
+            path.suffix.lower() in COMIC_EXT
+            and path not in self.queued
+            and not is_output(path, self.scheduler.in_place)
+        ):
+            last_size = self.pending.get(path, (None, None))[1]
+            self.pending[path] = (time.monotonic(), last_size)
+
+    def settled(self):
+        now = time.monotonic()
+        ready = []
+        for path, (last_event, last_size) in list(self.pending.items()):
+            try:
+                size = path.stat().st_size
+            except FileNotFoundError:
+                del self.pending[path]
+                continue
+            if size != last_size:
+                # Still growing (or first look), restart the quiet period
+                self.pending[path] = (now, size)
+            elif now - last_event >= self.settle:
+                del self.pending[path]
+                ready.append(path)
+        return ready
+
+    def handle_events(self):
+        for path, mask in self.inotify.read(1.0):
+            if path is None:
+                # Events were dropped, rescan to catch up
+                for comic in find_comics([self.inbox], self.scheduler.in_place):
+                    self.note(comic)
+            elif mask & Inotify.IN_ISDIR:
+                if mask & (Inotify.IN_CREATE | Inotify.IN_MOVED_TO):
+                    self.watch_tree(path)
+                    for comic in find_comics([path], self.scheduler.in_place):
+                        self.note(comic)
+            else:
+                self.note(path)
+
+    def should_skip(self, comic):
+        try:
+            if self.scheduler.filter_done([comic])[1] or is_webp_only(comic):
+                return True
+        except (OSError, zipfile.BadZipFile):
+            return False  # still being replaced, let the converter report it
+        return False
+
+    def submit(self, comic, archive_pool, pool, progress):
+        if self.should_skip(comic):
+            self.finish(comic, "skipped")
+            return
+        with self.lock:
+            self.queued.add(comic)
+        self.scheduler.metrics.adjust_queue("archives", 1)
+
+        def run():
+            with self.lock:
+                self.queued.discard(comic)
+                self.active.add(comic)
+            return self.scheduler.process(comic, pool, progress)
+
+        future = archive_pool.submit(run)
+        future.add_done_callback(
+            lambda f: self.finish(comic, self.scheduler.record_result(comic, f))
+        )
+
+    def finish(self, comic, status):
+        with self.lock:
+            self.active.discard(comic)
+            self.done[status] = self.done.get(status, 0) + 1
+            if status == "converted":
+                self.bytes_done += output_size(comic)
+        self.write_status()
+
+    def write_status(self):
+        if not self.status_path:
+            return
+        with self.lock:
+            elapsed = max(time.time() - self.started, 1e-9)
+            converted = self.done["converted"] + self.done["kept-original"]
+            status = {
+                "updated": round(time.time(), 3),
+                "inbox": str(self.inbox),
+                "settling": len(self.pending),
+                "queued": len(self.queued),
+                "active": sorted(str(p) for p in self.active),
+                "queue_length": len(self.pending) + len(self.queued),
+                "done": dict(self.done),
+                "archives_per_hour": round(converted / elapsed * 3600, 2),
+                "mb_per_min": round(self.bytes_done / 2**20 / elapsed * 60, 2),
+                "uptime_seconds": round(elapsed),
+            }
+        tmp = pathlib.Path(f"{self.status_path}.tmp")
+        tmp.write_text(json.dumps(status, indent=4))
+        os.replace(tmp, self.status_path)
+
+    def run(self):
+        scheduler = self.scheduler
+        self.watch_tree(self.inbox)
+        # Anything already sitting in the inbox is treated as freshly dropped
+        for comic in find_comics([self.inbox], self.scheduler.in_place):
+            self.note(comic)
+        console.print(f"[bold]Watching {self.inbox} for new archives[/bold]")
+
+        with Progress(console=console) as progress:
+            with ProcessPoolExecutor(max_workers=scheduler.jobs) as pool:
+                with ThreadPoolExecutor(max_workers=scheduler.archives) as archive_pool:
+                    try:
+                        while True:
+                            self.handle_events()
+                            for comic in self.settled():
+                                self.submit(comic, archive_pool, pool, progress)
+                            self.write_status()
+                    except KeyboardInterrupt:
+                        console.print("[yellow]Stopping after active archives[/yellow]")
+                        archive_pool.shutdown(cancel_futures=True)
+        self.inotify.close()
+        self.write_status()
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+
+from .detect import get_file_mime_type
+from .throttle import run_throttled
+from .trace import span
+from .utils import ENCODED_EXT, IMAGE_EXT, console
+from .zipread import extract_members
+
+# Bookkeeping files kept in each work directory so interrupted runs can resume
+EXTRACTED_MARKER = ".extracted"
+CHECKPOINT_FILE = ".checkpoint"
+
+
+def create_work_dir(filename, root=None):
+    # Archives from different folders can share a stem, so key on the full path
+    path_hash = hashlib.md5(str(filename.resolve()).encode()).hexdigest()[:8]
+    work_path = pathlib.Path(root or "./work") / f"{filename.stem}-{path_hash}"
+    work_path.mkdir(parents=True, exist_ok=True)
+    return work_path
+
+
+def source_stamp(filename):
+    stat = filename.stat()
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def extract_comic(work_path, filename, jobs=None):
+    # A finished extraction leaves a stamp of the source so a resumed run can
+    # reuse the pages; a stale stamp means the source changed underneath us
+    marker = work_path / EXTRACTED_MARKER
+    if marker.exists():
+        if marker.read_text() == source_stamp(filename):
+            console.print(f"[yellow]Reusing extracted pages for {filename}[/yellow]")
+            return
+        shutil.rmtree(work_path)
+        work_path.mkdir(parents=True)
+
+    filetype = get_file_mime_type(filename)
+    if not filetype:
+        # Packing an empty work directory would replace the source with nothing
+        raise ValueError(f"Unsupported file type: {filename}")
+
+    with span("extract", "archive", archive=filename.name, type=filetype):
+        if filetype == "zip":
+            # Decode members by offset in parallel rather than one at a time
+            extract_members(filename, work_path, jobs)
+        else:
+            # Argument lists rather than a shell string, so quotes in names are safe
+            command = (
+                ["unrar", "e", "-o+", "--", filename, f"{work_path}{os.sep}"]
+                if filetype == "rar"
+                else ["7z", "e", "-y", f"-o{work_path}", "--", filename]
+            )
+            # Paced as it runs, not just charged up front
+            run_throttled(command)
+    marker.write_text(source_stamp(filename))
+    console.print(f"[green]Extracted {filename}[/green]")
+
+
+def list_images(work_path):
+    return [f for f in work_path.iterdir() if f.suffix.lower() in IMAGE_EXT]
+
+
+def encoded_pages(work_path):
+    return [f for f in work_path.iterdir() if f.suffix.lower() in ENCODED_EXT]
+
+
+def encoded_page(work_path, page):
+    """The converted file for source ``page``, in whichever codec won, or None."""
+    stem = pathlib.Path(page).stem
+    for suffix in sorted(ENCODED_EXT):
+        path = work_path / f"{stem}{suffix}"
+        if path.exists():
+            return path
+    return None
+
+
+def load_checkpoint(work_path):
+    """Return the source pages already encoded in ``work_path``.
+
+    A page only counts as done if its converted file is still there with
+    the size recorded when it was checkpointed. Pages whose conversion was
+    discarded for being larger are recorded without a size.
+    """
+    checkpoint = work_path / CHECKPOINT_FILE
+    if not checkpoint.exists():
+        return set()
+    done = set()
+    for line in checkpoint.read_text().splitlines():
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            continue  # torn final line from a crash mid-write
+        out_path = encoded_page(work_path, entry["page"])
+        if entry["size"] is None:
+            if not out_path:
+                done.add(entry["page"])
+        elif out_path and out_path.stat().st_size == entry["size"]:
+            done.add(entry["page"])
+    return done
+
+
+def pending_pages(work_path):
+    files = list_images(work_path)
+    done = load_checkpoint(work_path)
+    if done:
+        console.print(
+            f"[yellow]Resuming {work_path.name}: "
+            f"{len(done)} of {len(files)} pages already converted[/yellow]"
+        )
+    return [f for f in files if f.name not in done]
+
+
+def open_checkpoint(work_path):
+    checkpoint = open(work_path / CHECKPOINT_FILE, "a+")
+    # Start on a fresh line if the last run died halfway through an entry
+    if checkpoint.tell():
+        checkpoint.seek(checkpoint.tell() - 1)
+        if checkpoint.read(1) != "\n":
+            checkpoint.write("\n")
+    return checkpoint
+
+
+def checkpoint_page(checkpoint, file, out_path):
+    size = out_path.stat().st_size if out_path else None
+    checkpoint.write(json.dumps({"page": file.name, "size": size}) + "\n")
+    checkpoint.flush()
+    os.fsync(checkpoint.fileno())
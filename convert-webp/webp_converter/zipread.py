@@ -0,0 +1,117 @@
+import contextlib
+import mmap
+import os
+import struct
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from .encoders import encode_member
+from .throttle import throttle
+from .trace import span
+from .utils import IMAGE_EXT
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+LOCAL_HEADER_MAGIC = 0x04034B50
+
+
+@dataclass(frozen=True)
+class MemberRef:
+    """Where one member lives in a zip, small enough to hand to a worker."""
+
+    name: str
+    offset: int
+    method: int
+    compressed: int
+    size: int
+    crc: int
+
+
+def central_directory(path):
+    """Read the central directory of ``path`` once and return its file members."""
+    with zipfile.ZipFile(path) as archive:
+        return [
+            MemberRef(
+                info.filename,
+                info.header_offset,
+                info.compress_type,
+                info.compress_size,
+                info.file_size,
+                info.CRC,
+            )
+            for info in archive.infolist()
+            if not info.is_dir()
+        ]
+
+
+@contextlib.contextmanager
+def mapped(path):
+    # Never cached past the block: a live map pins the file, and Windows then
+    # refuses to replace it in place
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            yield view
+
+
+def read_member(path, ref, view=None):
+    """Decode one member straight from its offset in the mapped archive.
+
+    Pass the ``view`` of an open ``mapped(path)`` block to read many members
+    from one map; without it the archive is mapped for this read alone.
+    """
+    if ref.method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+        # bzip2, lzma and friends are rare enough to leave to zipfile
+        with zipfile.ZipFile(path) as archive:
+            return archive.read(ref.name)
+    if view is None:
+        with mapped(path) as view:
+            return read_member(path, ref, view)
+
+    header = LOCAL_HEADER.unpack_from(view, ref.offset)
+    if header[0] != LOCAL_HEADER_MAGIC:
+        raise zipfile.BadZipFile(f"Bad local header for {ref.name} in {path}")
+    if header[2] & 0x1:
+        raise zipfile.BadZipFile(f"{ref.name} in {path} is encrypted")
+    # The local extra field can differ from the central one, so use its length
+    start = ref.offset + LOCAL_HEADER.size + header[9] + header[10]
+    data = view[start : start + ref.compressed]
+    if ref.method == zipfile.ZIP_DEFLATED:
+        data = zlib.decompress(data, -15)
+    if zlib.crc32(data) != ref.crc:
+        raise zipfile.BadZipFile(f"CRC mismatch for {ref.name} in {path}")
+    return data
+
+
+def encode_member_at(path, ref, options, quality=None, thumbnails=None):
+    """Worker side of a streamed conversion: read the page, then encode it."""
+    with span("read", "decode", page=ref.name):
+        data = read_member(path, ref)
+    return encode_member(ref.name, data, options, quality, thumbnails)
+
+
+def extract_members(path, work_path, jobs=None):
+    """Extract every member of a zip into ``work_path``, flattened like ``7z e``.
+
+    Members are decoded by offset on a thread pool; mmap reads and zlib both
+    release the GIL, so this scales with cores instead of running serially.
+    """
+
+    def extract(ref):
+        name = os.path.basename(ref.name)
+        if name:
+            throttle(ref.compressed + ref.size)
+            with span("extract member", "extract", page=name):
+                (work_path / name).write_bytes(read_member(path, ref, view))
+
+    members = central_directory(path)
+    with mapped(path) as view, ThreadPoolExecutor(max_workers=jobs) as pool:
+        list(pool.map(extract, members))
+
+
+def count_pages(path):
+    """Number of convertible pages in a zip, from its central directory alone."""
+    return sum(
+        os.path.splitext(ref.name)[1].lower() in IMAGE_EXT
+        for ref in central_directory(path)
+    )